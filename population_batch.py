@@ -0,0 +1,226 @@
+"""
+Batch mode for the analyses in the menu.
+
+Reads queries from a JSON Lines or CSV file (or from stdin) and answers all of them against one
+loaded dataset. Every query has an operation, the type of area (region or continent), one or two
+areas and a year, for example:
+
+    {"operation": "population_comparison", "type": "continent", "area": "Asia", "area2": "Europe", "year": 2021}
+
+The operations have the same names as the Region methods: display_population,
+population_comparison, population_sort, growth_calculator, growth_comparison and growth_sort.
+The answers are written as JSON Lines or CSV, one result per query, in the same order.
+
+    python population_batch.py queries.jsonl --output results.jsonl
+    python population_batch.py queries.csv --output-format csv < queries.csv
+    python population_batch.py queries.jsonl --metrics metrics.prom --profile
+"""
+import argparse
+import csv
+import json
+import sys
+from collections import namedtuple
+
+import population_instrumentation
+from population_group19 import Continent, Region
+from population_loader import load_data
+
+OUTPUT_FIELDS = ["operation", "type", "area", "area2", "year", "population", "population2", "larger",
+                 "growth_rate", "growth_rate2", "higher", "ranking", "error"]
+
+
+# A line of the input that could not be read as a query. run_query turns it into an error result,
+# so one bad line does not stop the run.
+InvalidQuery = namedtuple('InvalidQuery', ['message'])
+
+
+def read_queries(file, input_format):
+
+    # Yields the queries as dictionaries. Values from CSV files are all strings, the years are converted later.
+    if input_format == "csv":
+        yield from csv.DictReader(file)
+    else:
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield InvalidQuery(f"Line {number} is not valid JSON.")
+
+
+def parse_year(value):
+
+    # Returns the year of a query as an int, or None when it is not a whole number. Ints, floats
+    # without a fraction (2021.0) and strings of digits are accepted. True, 2021.9, 1e400 and
+    # Infinity are not years.
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str) and value.strip().isascii() and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+class BatchRunner:
+    def __init__(self, region, continent):
+
+        # Initialize the runner with one Region and one Continent instance that answer every query
+        self.instances = {"region": Region(region), "continent": Continent(continent)}
+
+        # The sorted lists only depend on the type and the year, so they are kept once they are made
+        self.rankings = {}
+
+    def ranking(self, instance, metric, year):
+
+        # Only years with data are kept, so queries for made-up years can not grow the cache without end
+        key = (instance.area_type(), metric, year)
+        ranking = self.rankings.get(key)
+        if ranking is None:
+            if metric == "population":
+                pairs = instance.population_ranking(year)
+            else:
+                pairs = instance.growth_ranking(year)
+            ranking = [{"area": area, metric: value} for area, value in pairs]
+            if year in instance.year_codes:
+                self.rankings[key] = ranking
+        return ranking
+
+    def run_query(self, query):
+
+        # Answers one query and returns the result as a dictionary. Queries that are not a dictionary,
+        # or have a type or areas that are not text, get a result with only an error.
+        if isinstance(query, InvalidQuery):
+            return {"error": query.message}
+        if not isinstance(query, dict):
+            return {"error": "The query must be a JSON object."}
+
+        operation = query.get("operation")
+        area_type = query.get("type") or "region"
+        area1 = query.get("area")
+        area2 = query.get("area2")
+        if "areas" in query:
+            if not isinstance(query["areas"], list):
+                return {"operation": operation, "error": "The areas of a query must be a list."}
+            area1, area2 = (query["areas"] + [None, None])[:2]
+        if not isinstance(area_type, str) or not all(area is None or isinstance(area, str) for area in (area1, area2)):
+            return {"operation": operation, "error": "The type, area and area2 of a query must be text."}
+
+        area_type = area_type.lower()
+        result = {"operation": operation, "type": area_type, "area": area1, "area2": area2}
+
+        year = parse_year(query.get("year"))
+        if year is None:
+            result["error"] = "The query needs a valid year."
+            return result
+        result["year"] = year
+
+        instance = self.instances.get(area_type)
+        if instance is None:
+            result["error"] = f"Unknown type {area_type}. Use region or continent."
+            return result
+
+        if operation == "display_population":
+            population = instance.lookup(area1, year)
+            if population is None:
+                result["error"] = f"No data available for {area1} in {year}."
+            result["population"] = population
+
+        elif operation == "population_comparison":
+            comparison = instance.population_comparison_result(area1, area2, year)
+            if comparison.first.population is None or comparison.second.population is None:
+                result["error"] = f"Data for one or both {area_type}s for the specified year is not available."
+            else:
+                result.update(population=comparison.first.population, population2=comparison.second.population,
+                              larger=comparison.larger)
+
+        elif operation == "growth_calculator":
+            growth_rate = instance.growth_rate(area1, year)
+            if growth_rate is None:
+                result["error"] = f"No growth rate available for {area1} in {year}."
+            result["growth_rate"] = growth_rate
+
+        elif operation == "growth_comparison":
+            comparison = instance.growth_comparison_result(area1, area2, year)
+            if comparison.first.growth_rate is None or comparison.second.growth_rate is None:
+                result["error"] = "Comparison could not be made due to insufficient data."
+            else:
+                result.update(growth_rate=comparison.first.growth_rate, growth_rate2=comparison.second.growth_rate,
+                              higher=comparison.higher)
+
+        elif operation in ("population_sort", "growth_sort"):
+            metric = "population" if operation == "population_sort" else "growth_rate"
+            ranking = self.ranking(instance, metric, year)
+            if not ranking:
+                result["error"] = f"No data available for {area_type}s in {year}."
+            result["ranking"] = ranking
+
+        else:
+            result["error"] = f"Unknown operation {operation}."
+
+        return result
+
+    def run(self, queries):
+
+        # Answers the queries one by one, in the order they were given
+        for query in queries:
+            yield self.run_query(query)
+
+
+def write_results(results, file, output_format):
+
+    if output_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            if "ranking" in result:
+                result = {**result, "ranking": json.dumps(result["ranking"], ensure_ascii=False)}
+            writer.writerow(result)
+    else:
+        for result in results:
+            file.write(json.dumps(result, ensure_ascii=False))
+            file.write("\n")
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Answer population queries in batch.")
+    parser.add_argument("queries", nargs="?", default="-", help="JSON Lines or CSV file with queries, - for stdin")
+    parser.add_argument("--input-format", choices=["jsonl", "csv"], help="default: from the file extension, jsonl for stdin")
+    parser.add_argument("--output", default="-", help="file for the results, - for stdout")
+    parser.add_argument("--output-format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--snapshot-dir", help="load the tables from the snapshots in this folder (built there "
+                                               "when missing) instead of the cache, so processes share one copy")
+    parser.add_argument("--metrics", help="time the methods and stages and write the metrics to this file, "
+                                          "in the Prometheus format for .prom and .txt, as JSON otherwise")
+    parser.add_argument("--profile", action="store_true", help="with --metrics, add a cProfile report of the run")
+    parser.add_argument("--memory", action="store_true", help="with --metrics, add the peak memory of the run")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.metrics:
+        population_instrumentation.enable(profile=arguments.profile, memory=arguments.memory)
+
+    input_format = arguments.input_format
+    if input_format is None:
+        input_format = "csv" if arguments.queries.endswith(".csv") else "jsonl"
+
+    runner = BatchRunner(*load_data(snapshot_dir=arguments.snapshot_dir))
+
+    input_file = sys.stdin if arguments.queries == "-" else open(arguments.queries, encoding="utf-8", newline="")
+    output_file = sys.stdout if arguments.output == "-" else open(arguments.output, "w", encoding="utf-8", newline="")
+    try:
+        with population_instrumentation.capture("batch"):
+            write_results(runner.run(read_queries(input_file, input_format)), output_file, arguments.output_format)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+        if arguments.metrics:
+            population_instrumentation.write_metrics(arguments.metrics)
+
+
+if __name__ == "__main__":
+    main()
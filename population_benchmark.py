@@ -0,0 +1,315 @@
+"""
+Benchmarks for loading, cleaning and the Region/Continent methods, on synthetic data.
+
+The synthetic tables have the same shape as the real ones (Year, Population, ±% p.a., Region_nr and
+the area column), with years that are 10 years apart until 2010 and annual after that, and can be
+made with any number of rows. For every benchmark the throughput (operations per second) and the
+peak memory are reported. Results can be saved as a baseline and compared with it later, so a
+slower growth_sort or lookup shows up as a number. The startup benchmarks time importing the
+classes, and the first query including loading the data, in a new Python process.
+
+    python population_benchmark.py --sizes 1000 10000 100000
+    python population_benchmark.py --save-baseline
+    python population_benchmark.py --baseline benchmark_baseline.json --fail-threshold 0.3
+    python population_benchmark.py --only startup --max-import-ms 100
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from population_group19 import Continent, Region
+from population_hierarchy import Hierarchy
+from population_loader import CsvSource, load_tables, split_tables
+from population_snapshot import read_snapshot, write_snapshot
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(PACKAGE_DIR, "benchmark_baseline.json")
+
+# Years like in the real data: every 10 years first, then every year
+SYNTHETIC_YEARS = np.array([1950, 1960, 1970, 1980, 1990, 2000, 2010] + list(range(2011, 2022)))
+
+# Number of lookups and comparisons per timing of the methods that answer one question
+QUERY_COUNT = 2000
+
+# Statements timed in a new Python process by the startup benchmarks
+STARTUP_STATEMENTS = {
+    "import_classes": "from population_group19 import Continent, Region",
+    "first_query": "import population_group19; population_group19.Region(population_group19.region).lookup('Caribbean', 2000)",
+}
+
+
+def synthetic_table(rows, area_type='region', seed=0):
+
+    # Makes a cleaned table with about `rows` rows: one series of SYNTHETIC_YEARS per area
+    generator = np.random.default_rng(seed)
+    areas = max(1, rows // len(SYNTHETIC_YEARS))
+    stretch = np.diff(SYNTHETIC_YEARS, prepend=SYNTHETIC_YEARS[0])
+    rates = generator.normal(0.015, 0.01, (areas, len(SYNTHETIC_YEARS)))
+    rates[:, 0] = 0
+    start = generator.integers(100_000, 1_000_000_000, areas).astype(np.float64)
+    populations = (start[:, None] * np.cumprod((1 + rates) ** stretch, axis=1)).round().astype(np.int64)
+
+    # The '±% p.a.' column is text, like "+2.21%", "−0.07%" and "—" for the first year of every area
+    percentages = pd.Series((rates * 100).ravel()).map('{:+.2f}%'.format).str.replace('-', '−', regex=False)
+    percentages[::len(SYNTHETIC_YEARS)] = '—'
+
+    return pd.DataFrame({
+        'Year': np.tile(SYNTHETIC_YEARS, areas),
+        'Population': populations.ravel(),
+        '±% p.a.': percentages.to_numpy(),
+        'Region_nr': np.repeat(np.arange(1, areas + 1), len(SYNTHETIC_YEARS)),
+        area_type.capitalize(): np.repeat([f"{area_type.capitalize()} {number}" for number in range(1, areas + 1)],
+                                          len(SYNTHETIC_YEARS)),
+    })
+
+
+def synthetic_hierarchy(areas):
+
+    # A hierarchy with every synthetic series as a region below one world continent
+    return Hierarchy(list(range(1, areas + 2)), [f"Region {number}" for number in range(1, areas + 1)] + ["World"],
+                     [areas + 1] * areas + [None], ["region"] * areas + ["continent"])
+
+
+def measure(function, repeat=3):
+
+    # Returns the best time of a few runs, and the peak memory of one extra run
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - begin)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def startup_time(statement, repeat=3):
+
+    # Runs a statement in new Python processes and returns the best time. The time is measured inside
+    # the process, so the start of the interpreter itself is not included.
+    code = f"import time; begin = time.perf_counter(); {statement}; print(time.perf_counter() - begin)"
+    timings = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, capture_output=True, text=True, check=True)
+        timings.append(float(process.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def method_benchmarks(table, cls, area_type, seed=0):
+
+    # Yields (name, function, operations) for every public method of Region (or Continent)
+    generator = np.random.default_rng(seed)
+    areas = table[area_type.capitalize()].unique()
+    years = SYNTHETIC_YEARS.tolist()
+    names = areas[generator.integers(0, len(areas), QUERY_COUNT)].tolist()
+    others = areas[generator.integers(0, len(areas), QUERY_COUNT)].tolist()
+    picked_years = [years[index] for index in generator.integers(0, len(years), QUERY_COUNT)]
+    queries = list(zip(names, others, picked_years))
+    instance = cls(table)
+
+    # Calculate the growth rates up front, so the query benchmarks measure the queries only
+    instance.growth_cache = instance.build_growth()
+
+    def each_query(method, pairs=False):
+        def run():
+            for area, other, year in queries:
+                if pairs:
+                    method(area, other, year)
+                else:
+                    method(area, year)
+        return run
+
+    def each_year(method):
+        def run():
+            for year in years:
+                method(year)
+        return run
+
+    def cold(method, sorted_years=years):
+        # Sorting benchmarks start without cached rankings, like the first question about every year
+        def run():
+            instance.rank_cache = {}
+            for year in sorted_years:
+                method(year)
+        return run
+
+    # The printed sorts render a table with every area, so they are only timed for a few years
+    printed_years = years[-3:]
+
+    yield "construct", lambda: cls(table), 1
+    yield "build_growth", instance.build_growth, 1
+    yield "build_ranks", lambda: instance.build_ranks('population'), 1
+    yield "lookup", each_query(instance.lookup), QUERY_COUNT
+    yield "lookup_many", lambda: instance.lookup_many([(area, year) for area, _, year in queries]), QUERY_COUNT
+    yield "growth_rate", each_query(instance.growth_rate), QUERY_COUNT
+    yield "display_population", each_query(instance.display_population), QUERY_COUNT
+    yield "population_comparison", each_query(instance.population_comparison, pairs=True), QUERY_COUNT
+    yield "growth_calculator", each_query(instance.growth_calculator), QUERY_COUNT
+    yield "growth_comparison", each_query(instance.growth_comparison, pairs=True), QUERY_COUNT
+    yield "population_sort", cold(instance.population_sort, printed_years), len(printed_years)
+    yield "growth_sort", cold(instance.growth_sort, printed_years), len(printed_years)
+    yield "population_sort_result", cold(instance.population_sort_result), len(years)
+    yield "growth_sort_result", cold(instance.growth_sort_result), len(years)
+    yield "top_k", each_year(lambda year: instance.top_k(year, 10)), len(years)
+    yield "rank_of", each_query(instance.rank_of), QUERY_COUNT
+    yield "interpolate_many", lambda: instance.timeseries.interpolate_many(names, np.array(picked_years) + 0.5), QUERY_COUNT
+
+
+def loading_benchmarks(rows, directory, seed=0):
+
+    # Yields (name, function, rows) for cleaning the raw tables and loading the data from CSV and snapshots
+    table = synthetic_table(rows, seed=seed)
+    raw = table[['Year', 'Population', '±% p.a.']].rename(columns={'Population': 'Pop.'})
+    areas = table['Region_nr'].max()
+
+    raw_path = os.path.join(directory, "raw.csv")
+    raw.to_csv(raw_path, index=False)
+    hierarchy = synthetic_hierarchy(areas)
+    hierarchy_path = os.path.join(directory, "hierarchy.csv")
+    pd.DataFrame({'Series': hierarchy.series, 'Name': hierarchy.names,
+                  'Parent': [areas + 1] * areas + [None], 'Table': hierarchy.tables}).to_csv(hierarchy_path, index=False)
+    clean_path = os.path.join(directory, "region.csv")
+    table.to_csv(clean_path, index=False)
+    snapshot_path = os.path.join(directory, "snapshot")
+    write_snapshot(table, snapshot_path)
+    cache_dir = os.path.join(directory, "cache")
+
+    def cold_load():
+        for name in os.listdir(cache_dir) if os.path.exists(cache_dir) else []:
+            os.remove(os.path.join(cache_dir, name))
+        load_tables(CsvSource(raw_path), hierarchy_path, cache_dir)
+
+    yield "clean_tables", lambda: split_tables([raw], hierarchy), len(table)
+    yield "load_cold", cold_load, len(table)
+    yield "load_cached", lambda: load_tables(CsvSource(raw_path), hierarchy_path, cache_dir), len(table)
+    yield "read_csv", lambda: pd.read_csv(clean_path), len(table)
+    yield "read_snapshot", lambda: read_snapshot(snapshot_path), len(table)
+
+
+def run_benchmarks(sizes, repeat=3, seed=0, only=None):
+
+    # Runs every benchmark for every table size and returns a list of results
+    results = []
+
+    def add_result(group, name, rows, operations, seconds, peak):
+        result = {"benchmark": f"{group}.{name}", "rows": rows, "operations": operations, "seconds": seconds,
+                  "ops_per_second": operations / seconds if seconds > 0 else float("inf"),
+                  "peak_mb": peak / 1e6 if peak is not None else None}
+        results.append(result)
+        peak_text = f"{result['peak_mb']:>10.1f} MB" if peak is not None else f"{seconds * 1000:>10.1f} ms"
+        print(f"{result['benchmark']:<32} {rows:>10} rows {result['ops_per_second']:>14,.1f} ops/s {peak_text}",
+              file=sys.stderr)
+
+    def record(group, name, rows, function, operations):
+        if only and not any(part in f"{group}.{name}" for part in only):
+            return
+        seconds, peak = measure(function, repeat)
+        add_result(group, name, rows, operations, seconds, peak)
+
+    # Startup is measured in new processes, so there is no peak memory from tracemalloc for it
+    for name, statement in STARTUP_STATEMENTS.items():
+        if not only or any(part in f"startup.{name}" for part in only):
+            add_result("startup", name, 0, 1, startup_time(statement, repeat), None)
+
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        for rows in sizes:
+            for group, cls in (("region", Region), ("continent", Continent)):
+                table = synthetic_table(rows, group, seed)
+                for name, function, operations in method_benchmarks(table, cls, group, seed):
+                    record(group, name, len(table), function, operations)
+                    # The display methods print, and their output is thrown away between benchmarks
+                    output.seek(0)
+                    output.truncate()
+            with tempfile.TemporaryDirectory() as directory:
+                for name, function, operations in loading_benchmarks(rows, directory, seed):
+                    record("loading", name, operations, function, operations)
+    return results
+
+
+def compare(results, baseline, threshold):
+
+    # Prints the change against the baseline and returns the benchmarks that got slower than the threshold
+    regressions = []
+    print(f"{'benchmark':<32} {'rows':>10} {'ops/s':>14} {'baseline':>14} {'change':>8} {'peak MB':>9}")
+    for result in results:
+        key = f"{result['benchmark']}@{result['rows']}"
+        old = baseline.get("results", {}).get(key)
+        change = ""
+        if old:
+            ratio = result["ops_per_second"] / old["ops_per_second"] - 1
+            change = f"{ratio:+.0%}"
+            if ratio < -threshold:
+                regressions.append(key)
+        old_text = f"{old['ops_per_second']:,.1f}" if old else "-"
+        peak_text = f"{result['peak_mb']:.1f}" if result['peak_mb'] is not None else "-"
+        print(f"{result['benchmark']:<32} {result['rows']:>10} {result['ops_per_second']:>14,.1f} {old_text:>14} "
+              f"{change:>8} {peak_text:>9}")
+    return regressions
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Benchmark the population analyses on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="numbers of rows, up to 10000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="only run benchmarks with one of these words in their name")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--fail-threshold", type=float, default=None,
+                        help="exit with an error when a benchmark is this much slower than the baseline, e.g. 0.3")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="exit with an error when importing Region and Continent takes longer, e.g. 100")
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(arguments.sizes, arguments.repeat, only=arguments.only)
+
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    regressions = compare(results, baseline, arguments.fail_threshold if arguments.fail_threshold is not None else float("inf"))
+
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
+
+    if arguments.save_baseline:
+        stored = {
+            "machine": f"{platform.machine()} {platform.processor()} {platform.python_version()}".strip(),
+            "results": {f"{result['benchmark']}@{result['rows']}": {"ops_per_second": result["ops_per_second"],
+                                                                    "peak_mb": result["peak_mb"]}
+                        for result in results},
+        }
+        with open(arguments.baseline, "w", encoding="utf-8") as file:
+            json.dump(stored, file, indent=1, sort_keys=True)
+            file.write("\n")
+        print(f"Baseline saved to {arguments.baseline}")
+
+    import_times = [result["seconds"] * 1000 for result in results if result["benchmark"] == "startup.import_classes"]
+    if arguments.max_import_ms is not None and import_times and import_times[0] > arguments.max_import_ms:
+        regressions.append(f"startup.import_classes took {import_times[0]:.1f} ms")
+
+    if regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
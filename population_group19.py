@@ -1,90 +1,48 @@
-from tabulate import tabulate
-import pandas as pd
-
-# Extracting the data from Wikipedia by using the pandas library
-url = "https://en.wikipedia.org/wiki/List_of_continents_and_continental_subregions_by_population"
-tables = pd.read_html(url)
-
-# When extracting data from the Wikipedia page, the data is unstructured and needs to be cleaned
-# Table for all regions
-region_tables = tables[3:]  
-region = pd.concat(region_tables, ignore_index=True)
-region.to_csv("region.csv", index=False)
-
-
-# Renaming the columns to make them identical
-region = region.rename(columns={'Pop.': 'Population'})
-
-
-# The table for regions dont have the same structure as the other tables. 
-# The table for regions needs to be cleaned and structured
-# The table do not have region name but just Year and Population. 
-# First step is therefore to create a new column with the Region_nr where each unique region is assigned a number based on repeated data from 1950 to 2021
-region['Region_nr'] = (region['Year'] == 1950).cumsum()
-
-# Define mapping between region number and region name 
-region_mapping = {
-    1: "Eastern Africa",
-    2: "Middle Africa",
-    3: "Northern Africa",
-    4: "Southern Africa",
-    5: "Western Africa",
-    6: "Total Africa",
-    7: "Total Americas",
-    8: "Caribbean",
-    9: "Central America",
-    10: "North America",
-    11: "Total North America",
-    12: "Total South America",
-    13: "Central Asia",
-    14: "Eastern Asia",
-    15: "South-Eastern Asia",
-    16: "Southern Asia",
-    17: "Western Asia",
-    18: "Total Asia",
-    19: "Eastern Europe",
-    20: "North Europe",
-    21: "Southern Europe",
-    22: "Western Europe",
-    23: "Total Europe",
-    24: "Total Oceania",
-    25: "Total World",
-}
-
-# Adding a new column 'Region' by mappiung region number with the name 
-region['Region'] = region['Region_nr'].map(region_mapping)
-
-# Defining the continent identifiers from the list
-continent_identifiers = {6, 11, 12, 18, 23, 24, 25}
-
-# Extracting the continent data with the identified continent identifiers
-continent = region[region['Region_nr'].isin(continent_identifiers)].copy()
-
-continent = continent.rename(columns={'Region': 'Continent'})
-
-# Renaming values in the Continent column
-continent['Continent'] = continent['Continent'].replace({
-    'Total Africa': 'Africa',
-    'Total Americas': 'Americas',
-    'Total Asia': 'Asia',
-    'Total Europe': 'Europe',
-    'Total Oceania': 'Oceania',
-    'Total World': 'World',
-    'Total North America': 'North America',
-    'Total South America': 'South America'
-})
-
-# Dropping the continent rows from the original DataFrame 
-region = region[~region['Region_nr'].isin(continent_identifiers)].copy()
-
-# Saving the continent DataFrame
-continent.to_csv("continent.csv", index=False)
+import importlib
 
+from population_instrumentation import register
+from population_results import (GrowthComparison, GrowthResult, PopulationComparison, PopulationResult,
+                                Ranking, render)
+
+
+class LazyModule:
+    # Stands in for a module that is only imported when it is first used, so importing Region and
+    # Continent does not import numpy and pandas. On first use the real module takes its place.
+
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attribute)
+
+
+np = LazyModule('numpy', 'np')
+pd = LazyModule('pandas', 'pd')
+
+
+def __getattr__(name):
+
+    # The cleaned region and continent DataFrames are loaded on first access, like population_group19.region,
+    # and not when the module is imported
+    if name in ('region', 'continent'):
+        from population_loader import load_data
+
+        globals()['region'], globals()['continent'] = load_data()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@register
 class Region:
     def __init__(self, data):
         
         # Initialize the Region class with a DataFrame containing Year, Population, and Region.
         self.data = data
+
+        # Build the (area, year) lookup index once, so lookups don't have to scan the whole DataFrame
+        self.build_index()
     
     """
     This function was working too, but it once again made the class/subclass structure unnecessary
@@ -104,132 +62,462 @@ class Region:
         area_type = 'region'
         return area_type
 
-    def display_population(self, area_name, year):
+    @property
+    def data(self):
+        
+        # The DataFrame behind the index. Rows added with append are only joined to it when the
+        # DataFrame is used, so appending a few rows does not copy the whole table.
+        # The row labels are not used, so the joined table gets a range index that takes no memory per row.
+        # The table and the appended rows are kept together in one tuple, so threads that read .data at
+        # the same time always see a matching pair: at worst they both join the same rows, never twice.
+        table, appended_rows = self.table_parts
+        if appended_rows:
+            table = pd.concat([table, *appended_rows], ignore_index=True)
+            self.table_parts = (table, ())
+        return table
+
+    @data.setter
+    def data(self, data):
+        self.table_parts = (data, ())
+
+    def build_index(self):
         
         area_type = self.area_type()
         
-        # Display the population of a specific region in a specific year.
-        area_data = self.data[(self.data[area_type.capitalize()] == area_name) & (self.data['Year'] == year)]
-        if not area_data.empty:
-            population = area_data['Population'].iloc[0]
-            print(f"Population of {area_name} in {year}: {population:,}")
-        else:
-            print(f"No data available for {area_name} in {year}.")
+        # Builds a dense area-by-year matrix with the populations, together with dictionaries
+        # that map each area name and year to its row and column in the matrix.
+        # Combinations without data are marked with -1 in the matrix.
+        area_codes, area_names = pd.factorize(self.data[area_type.capitalize()])
+        year_codes, years = pd.factorize(self.data['Year'])
+        populations = self.data['Population'].to_numpy(dtype=np.int64)
+
+        # Rows with a missing area or year get the code -1 and are left out of the index
+        valid = (area_codes >= 0) & (year_codes >= 0)
+        area_codes, year_codes, populations = area_codes[valid], year_codes[valid], populations[valid]
+
+        # When an (area, year) pair occurs more than once the first row is used,
+        # just like .iloc[0] did when the lookups were made with boolean masks
+        _, first_rows = np.unique(area_codes * len(years) + year_codes, return_index=True)
+
+        self.population_matrix = np.full((len(area_names), len(years)), -1, dtype=np.int64)
+        self.population_matrix[area_codes[first_rows], year_codes[first_rows]] = populations[first_rows]
+
+        # The names and years in the order of their codes are kept as plain lists. They are the choices
+        # the menu shows, and turn codes back into names without going through pandas.
+        self.area_names = area_names.tolist()
+        self.years = years.tolist()
+        self.area_index = pd.Index(self.area_names, dtype=object)
+        self.year_index = pd.Index(self.years, dtype=np.int64)
+        self.area_codes = {name: code for code, name in enumerate(self.area_names)}
+        self.year_codes = {year: code for code, year in enumerate(self.years)}
+
+        # The growth rates and time series belong to the old index, so they are made again on next use
+        self.invalidate_growth()
+        self.timeseries_cache = None
+
+    def invalidate_growth(self):
+        
+        # Drops the cached growth rates and rankings. Call this when the populations behind the index change.
+        self.growth_cache = None
+        self.rank_cache = {}
 
-    def population_comparison(self, area_name1, area_name2, year):
+    @property
+    def growth_matrix(self):
         
-        area_type = self.area_type()
+        # The growth rates of every (area, year) pair, laid out like population_matrix.
+        # They are calculated on first use and kept until invalidate_growth is called. The matrix
+        # is read-only and only append changes self.data, so one instance can be shared between
+        # threads without locks: if two threads build the cache at the same time they make the same matrix.
+        growth_matrix = self.growth_cache
+        if growth_matrix is None:
+            growth_matrix = self.build_growth()
+            self.growth_cache = growth_matrix
+        return growth_matrix
+
+    @property
+    def timeseries(self):
         
-        # Compares the population between two regions in a specific year.
-        area_data1 = self.data[(self.data[area_type.capitalize()] == area_name1) & (self.data['Year'] == year)]
-        area_data2 = self.data[(self.data[area_type.capitalize()] == area_name2) & (self.data['Year'] == year)]
-        if not area_data1.empty and not area_data2.empty:
-            population1 = area_data1['Population'].iloc[0]
-            population2 = area_data2['Population'].iloc[0]
-            print(f"Population in {area_name1} in {year}: {population1:,}") 
-            print(f"Population in {area_name2} in {year}: {population2:,}")
-        else: 
-            print(f"Data for one or both {area_type}s for the specified year is not available.")
-        if population1 > population2:
-            print(f"{area_name1}s population was greater than {area_name2}s population.")
-        elif population2 > population1:
-            print(f"{area_name2}s population was greater than {area_name1}s population.")
-        elif population1 == population2:
-            print(f"You cannot compare the same {area_type}")
+        # The per-area time series of the populations, used to estimate the population in years that
+        # are not in the data (see population_timeseries). It is built on first use.
+        timeseries = self.timeseries_cache
+        if timeseries is None:
+            from population_timeseries import TimeSeriesStore
+
+            timeseries = TimeSeriesStore.from_frame(self.data, self.area_type().capitalize())
+            self.timeseries_cache = timeseries
+        return timeseries
+
+    def build_growth(self, area_codes=None):
+        
+        # Calculates the growth rate of every area in every year in one pass over the population matrix
+        # and returns them as a float64 matrix with NaN where there is no growth rate.
+        # Like growth_calculator always did, each year is compared with the closest previous year
+        # that has data, so datasets recorded every 10 years and every year are both handled.
+        # When area_codes is given, only the rows of those areas are calculated and returned.
+        year_order = np.argsort(self.year_index.to_numpy(), kind='stable')
+        rows = self.population_matrix if area_codes is None else self.population_matrix[area_codes]
+        populations = rows[:, year_order].astype(np.float64)
+        has_data = populations >= 0
+
+        # For every cell, find the column of the closest previous year with data (-1 if there is none)
+        columns = np.where(has_data, np.arange(populations.shape[1]), -1)
+        last_column = np.maximum.accumulate(columns, axis=1)
+        previous_column = np.full_like(last_column, -1)
+        previous_column[:, 1:] = last_column[:, :-1]
+        previous = np.take_along_axis(populations, np.maximum(previous_column, 0), axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(has_data & (previous_column >= 0), (populations - previous) / previous * 100, np.nan)
+
+        # Put the years back in the same order as the population matrix
+        growth_matrix = np.empty_like(growth)
+        growth_matrix[:, year_order] = growth
+        growth_matrix.setflags(write=False)
+        return growth_matrix
+
+    def append(self, rows):
         
+        # Adds new rows (with Year, Population and the area column) and updates the index in place,
+        # instead of building it again. Only (area, year) pairs that are not in the data yet are added,
+        # so existing rows keep winning like the first row always does. The growth rates and rankings
+        # are only calculated again for the areas and years that changed. Returns the added rows.
+        # Like build_index this changes the instance, so it should not run while other threads use it.
+        area_column = self.area_type().capitalize()
+        rows = rows.dropna(subset=[area_column, 'Year', 'Population']).drop_duplicates(subset=[area_column, 'Year'], keep='first')
+        rows = rows.reindex(columns=self.table_parts[0].columns)
+        area_codes = self.area_index.get_indexer(rows[area_column])
+        year_codes = self.year_index.get_indexer(rows['Year'])
+        known = (area_codes >= 0) & (year_codes >= 0)
+        exists = np.zeros(len(rows), dtype=bool)
+        exists[known] = self.population_matrix[area_codes[known], year_codes[known]] >= 0
+        rows = rows[~exists]
+        if len(rows) == 0:
+            return rows
+
+        # New areas and years get the next codes, and the matrix gets rows and columns for them
+        old_shape = self.population_matrix.shape
+        new_areas = pd.unique(rows[area_column][area_codes[~exists] < 0]).tolist()
+        new_years = pd.unique(rows['Year'][year_codes[~exists] < 0].astype(np.int64)).tolist()
+        if len(new_areas) or len(new_years):
+            self.area_names.extend(new_areas)
+            self.years.extend(new_years)
+            self.area_index = pd.Index(self.area_names, dtype=object)
+            self.year_index = pd.Index(self.years, dtype=np.int64)
+            self.area_codes.update((name, code) for code, name in enumerate(new_areas, old_shape[0]))
+            self.year_codes.update((year, code) for code, year in enumerate(new_years, old_shape[1]))
+            population_matrix = np.full((len(self.area_index), len(self.year_index)), -1, dtype=np.int64)
+            population_matrix[:old_shape[0], :old_shape[1]] = self.population_matrix
+            self.population_matrix = population_matrix
+
+        area_codes = self.area_index.get_indexer(rows[area_column])
+        year_codes = self.year_index.get_indexer(rows['Year'])
+        self.population_matrix[area_codes, year_codes] = rows['Population'].to_numpy(dtype=np.int64)
+
+        rows = self.match_column_types(rows)
+        table, appended_rows = self.table_parts
+        self.table_parts = (table, appended_rows + (rows,))
+        self.update_caches(np.unique(area_codes), np.unique(year_codes), old_shape)
+        self.timeseries_cache = None
+        return rows
+
+    def match_column_types(self, rows):
+        
+        # Gives new rows the column types of the table, so appending keeps the compact storage of the
+        # loader (categories, int16 years, float growth strings). New area names are added to the
+        # categories of the table first, because pandas only keeps a categorical column when all parts
+        # have the same categories. Integer columns the new rows don't have, like Region_nr, become -1.
+        from population_storage import fits_in, parse_growth_strings
+
+        rows = rows.copy()
+        table, appended_rows = self.table_parts
+        for column, dtype in table.dtypes.items():
+            values = rows[column]
+            if isinstance(dtype, pd.CategoricalDtype):
+                new_categories = [value for value in pd.unique(values.dropna()) if value not in dtype.categories]
+                if new_categories:
+                    table = table.assign(**{column: table[column].cat.add_categories(new_categories)})
+                    dtype = table[column].dtype
+                    appended_rows = tuple(part.astype({column: dtype}) for part in appended_rows)
+                    self.table_parts = (table, appended_rows)
+                rows[column] = pd.Categorical(values, dtype=dtype)
+            elif pd.api.types.is_integer_dtype(dtype):
+                integers = values.fillna(-1).to_numpy(dtype=np.int64)
+                if not fits_in(integers, dtype):
+                    raise ValueError(f"The new values of {column} do not fit in its {dtype} column.")
+                rows[column] = integers.astype(dtype)
+            elif column == '±% p.a.' and pd.api.types.is_float_dtype(dtype):
+                rows[column] = parse_growth_strings(values)
+            else:
+                rows[column] = values.astype(dtype)
+        return rows
 
-    def population_sort(self, year):
+    def update_caches(self, area_codes, year_codes, old_shape):
         
-        area_type = self.area_type()
+        # Updates the cached growth rates and rankings after the populations of some areas changed in some
+        # years (see append). Only the growth rates of those areas are calculated again, and only the
+        # rankings of years where a population or growth rate changed are dropped.
+        growth_years = None
+        growth_matrix = self.growth_cache
+        if growth_matrix is not None:
+            growth_matrix = np.full(self.population_matrix.shape, np.nan)
+            growth_matrix[:old_shape[0], :old_shape[1]] = self.growth_cache
+            old_rows = growth_matrix[area_codes]
+            new_rows = self.build_growth(area_codes)
+            changed = (old_rows != new_rows) & ~(np.isnan(old_rows) & np.isnan(new_rows))
+            growth_years = set(np.flatnonzero(changed.any(axis=0)).tolist())
+            growth_matrix[area_codes] = new_rows
+            growth_matrix.setflags(write=False)
+            self.growth_cache = growth_matrix
+
+        # A growth ranking also changes when an area gets data in a year without getting a growth rate.
+        # New areas have no data in the years that did not change, so they only get a rank of 0 there.
+        population_years = set(year_codes.tolist())
+        if growth_years is not None:
+            growth_years |= population_years
+        new_area_count = self.population_matrix.shape[0] - old_shape[0]
+        for metric, year_code in list(self.rank_cache):
+            changed_years = population_years if metric == 'population' else growth_years
+            if changed_years is None or year_code in changed_years:
+                del self.rank_cache[metric, year_code]
+            elif new_area_count:
+                order, ranks = self.rank_cache[metric, year_code]
+                self.rank_cache[metric, year_code] = (order, np.concatenate([ranks, np.zeros(new_area_count, dtype=np.int64)]))
+
+    def lookup(self, area_name, year):
         
-        # Sort regions by population size in a specific year
-        unsorted_data = self.data[(self.data['Year'] == year)]
-        if not unsorted_data.empty:
-            sorted_data = unsorted_data.sort_values(by=['Population'], ascending=False)
-            print(f"Here are {area_type}s sorted population in the year {year}:\n{sorted_data}")
+        # Returns the population of an area in a specific year, or None if there is no data.
+        # The lookup uses the prebuilt index, so it takes constant time regardless of the table size.
+        area_code = self.area_codes.get(area_name)
+        year_code = self.year_codes.get(year)
+        if area_code is None or year_code is None:
+            return None
+        population = self.population_matrix[area_code, year_code]
+        if population < 0:
+            return None
+        return int(population)
+
+    def lookup_many(self, queries):
+        
+        # Looks up the population for a list of (area, year) pairs in one vectorized call.
+        # Returns a NumPy array with one population per query, and -1 where there is no data.
+        result = np.full(len(queries), -1, dtype=np.int64)
+        if len(queries) == 0:
+            return result
+        area_names, years = zip(*queries)
+        area_codes = self.area_index.get_indexer(list(area_names))
+        year_codes = self.year_index.get_indexer(list(years))
+        found = (area_codes >= 0) & (year_codes >= 0)
+        result[found] = self.population_matrix[area_codes[found], year_codes[found]]
+        return result
+
+    def growth_rate(self, area_name, year):
+        
+        # Returns the growth rate of an area in a specific year without printing anything,
+        # or None if there is no data for that year or for an earlier year.
+        if self.lookup(area_name, year) is None:
+            return None
+        growth_rate = self.growth_matrix[self.area_codes[area_name], self.year_codes[year]]
+        if np.isnan(growth_rate):
+            return None
+        return float(growth_rate)
+
+    def sort_keys(self, metric, year_codes):
+        
+        # Returns the keys that areas are ranked by for the given year columns: the negative value, so the
+        # highest value comes first, +inf for areas with data but without a value (the first year has no
+        # growth rate), and NaN for areas without data in that year, which are left out of the rankings.
+        if metric == 'population':
+            values = self.population_matrix[:, year_codes].astype(np.float64)
+        elif metric == 'growth_rate':
+            values = self.growth_matrix[:, year_codes]
+        else:
+            raise ValueError(f"Unknown metric {metric}. Use 'population' or 'growth_rate'.")
+        has_data = self.population_matrix[:, year_codes] >= 0
+        keys = np.where(np.isnan(values), np.inf, -values)
+        keys[~has_data] = np.nan
+        return keys
+
+    def build_ranks(self, metric, years=None):
+        
+        # Sorts the areas for every year (or the given years) at once and caches the result per
+        # (metric, year): the area codes from first to last, and the rank of every area (0 without data).
+        # Areas with the same value keep the order of their area codes.
+        if years is None:
+            year_codes = np.arange(len(self.year_index))
         else:
-            print(f"No data available for {area_type}s in {year}.")
+            year_codes = np.asarray([self.year_codes[year] for year in years], dtype=np.int64)
+        keys = self.sort_keys(metric, year_codes)
+        orders = np.argsort(keys, axis=0, kind='stable')
+        counts = np.count_nonzero(~np.isnan(keys), axis=0)
+        ranks = np.zeros(keys.shape, dtype=np.int64)
+        np.put_along_axis(ranks, orders, np.arange(1, len(keys) + 1)[:, None], axis=0)
+        ranks[np.isnan(keys)] = 0
+        for column, year_code in enumerate(year_codes.tolist()):
+            self.rank_cache[metric, year_code] = (orders[:counts[column], column], ranks[:, column])
+
+    def ranks(self, metric, year_code):
         
+        # Returns the cached (order, ranks) of one year, and sorts that year first if needed
+        ranks = self.rank_cache.get((metric, year_code))
+        if ranks is None:
+            self.build_ranks(metric, [self.year_index[year_code]])
+            ranks = self.rank_cache[metric, year_code]
+        return ranks
+
+    def ranked_value(self, metric, area_code, year_code):
+        
+        # Returns the value an area is ranked by as a Python number, or None for a missing growth rate
+        if metric == 'population':
+            return int(self.population_matrix[area_code, year_code])
+        growth_rate = self.growth_matrix[area_code, year_code]
+        return None if np.isnan(growth_rate) else float(growth_rate)
 
-    def growth_calculator(self, area_name, year):
+    def ranking(self, year, metric):
         
-        area_type = self.area_type()
+        # Returns (area, value) pairs for all areas with data in a specific year, sorted from the
+        # highest to the lowest value. Areas with data but without a value are placed last.
+        year_code = self.year_codes.get(year)
+        if year_code is None:
+            return []
+        order, _ = self.ranks(metric, year_code)
+        return [(self.area_names[code], self.ranked_value(metric, code, year_code)) for code in order.tolist()]
+
+    def population_ranking(self, year):
         
-        # Calculates the annual growth rate of a region for a given year,
-        # accounting for datasets where population is recorded every 10 years.
+        # Returns (area, population) pairs for a specific year, from the largest to the smallest population
+        return self.ranking(year, 'population')
+
+    def growth_ranking(self, year):
         
-        # Filter data for the specified region
-        area_data = self.data[self.data[area_type.capitalize()] == area_name]
+        # Returns (area, growth rate) pairs for a specific year, from the highest to the lowest growth rate
+        return self.ranking(year, 'growth_rate')
 
-        # Ensure the requested year exists in the data
-        if year not in area_data['Year'].values:
-            print(f"No data available for {area_name} in {year}.")
+    def top_k(self, year, k, metric='population'):
+        
+        # Returns the k areas with the highest population or growth rate in a specific year as (area, value) pairs.
+        # When the year has been sorted before the cached order is used. Otherwise only the k best areas
+        # are selected with np.partition and sorted, without sorting the whole year.
+        year_code = self.year_codes.get(year)
+        if year_code is None or k <= 0:
+            return []
+        cached = self.rank_cache.get((metric, year_code))
+        if cached is not None:
+            top = cached[0][:k]
+        else:
+            keys = self.sort_keys(metric, [year_code])[:, 0]
+            areas = np.flatnonzero(~np.isnan(keys))
+            keys = keys[areas]
+            k = min(k, len(areas))
+            if k == 0:
+                return []
+            kth_key = np.partition(keys, k - 1)[k - 1]
+            better = np.flatnonzero(keys < kth_key)
+            tied = np.flatnonzero(keys == kth_key)[:k - len(better)]
+            selected = np.concatenate([better, tied])
+            top = areas[selected[np.lexsort((selected, keys[selected]))]]
+        return [(self.area_names[code], self.ranked_value(metric, code, year_code)) for code in top.tolist()]
+
+    def rank_of(self, area_name, year, metric='population'):
+        
+        # Returns the rank (1 is the highest) of an area in a specific year, or None if it has no data.
+        # Uses the cached ranks when the year has been sorted, and otherwise counts the areas ranked above it.
+        area_code = self.area_codes.get(area_name)
+        year_code = self.year_codes.get(year)
+        if area_code is None or year_code is None:
+            return None
+        cached = self.rank_cache.get((metric, year_code))
+        if cached is not None:
+            rank = int(cached[1][area_code])
+            return rank if rank > 0 else None
+        keys = self.sort_keys(metric, [year_code])[:, 0]
+        key = keys[area_code]
+        if np.isnan(key):
             return None
+        return int(np.count_nonzero(keys < key) + np.count_nonzero(keys[:area_code] == key)) + 1
 
-        # Find the closest previous year with data
-        previous_year_data = area_data[area_data['Year'] < year].sort_values(by='Year', ascending=False)
+    def population_result(self, area_name, year):
+        
+        # Returns the population of an area in a specific year as a PopulationResult
+        return PopulationResult(self.area_type(), area_name, year, self.lookup(area_name, year))
 
-        if previous_year_data.empty:
-            print(f"No previous data available for {area_name} before {year}.")
-            return None
+    def population_comparison_result(self, area_name1, area_name2, year):
+        
+        # Returns the populations of two areas in a specific year as a PopulationComparison
+        return PopulationComparison(self.population_result(area_name1, year), self.population_result(area_name2, year))
+
+    def population_sort_result(self, year):
+        
+        # Returns the areas sorted by population size in a specific year as a Ranking
+        return Ranking(self.area_type(), 'population', year, self.population_ranking(year))
+
+    def growth_result(self, area_name, year):
+        
+        # Returns the growth rate of an area in a specific year as a GrowthResult
+        has_data = self.lookup(area_name, year) is not None
+        return GrowthResult(self.area_type(), area_name, year, self.growth_rate(area_name, year), has_data)
+
+    def growth_comparison_result(self, area1, area2, year):
+        
+        # Returns the growth rates of two areas in a specific year as a GrowthComparison
+        return GrowthComparison(self.growth_result(area1, year), self.growth_result(area2, year))
+
+    def growth_sort_result(self, year):
+        
+        # Returns the areas sorted by growth rate in a specific year as a Ranking
+        return Ranking(self.area_type(), 'growth_rate', year, self.growth_ranking(year))
+
+    # The methods below are used by the menu. They print the results and return them as well.
 
-        # Get the populations for the current and previous years
-        current_population = area_data[area_data['Year'] == year]['Population'].iloc[0]
-        previous_population = previous_year_data['Population'].iloc[0]
-        previous_year = previous_year_data['Year'].iloc[0]
+    def display_population(self, area_name, year):
+        
+        # Display the population of a specific region in a specific year.
+        result = self.population_result(area_name, year)
+        print(render(result))
+        return result
+
+    def population_comparison(self, area_name1, area_name2, year):
+        
+        # Compares the population between two regions in a specific year.
+        result = self.population_comparison_result(area_name1, area_name2, year)
+        print(render(result))
+        return result
 
-        # Calculate growth rate
-        growth_rate = ((current_population - previous_population) / previous_population) * 100
+    def population_sort(self, year):
+        
+        # Sort regions by population size in a specific year
+        result = self.population_sort_result(year)
+        print(render(result))
+        return result
 
-        self.data.loc[(self.data[area_type.capitalize()] == area_name) & (self.data['Year'] == year), 'Growth Rate'] = growth_rate
+    def growth_calculator(self, area_name, year):
+        
+        # Calculates the annual growth rate of a region for a given year,
+        # accounting for datasets where population is recorded every 10 years.
+        # The growth rates come from the cached growth_matrix, so this is only a lookup.
+        result = self.growth_result(area_name, year)
 
-        # Display or return growth rate
-        print(f"Growth rate for {area_name} in {year}: {growth_rate:.2f}%")
-        return growth_rate
+        # Display and return growth rate
+        print(render(result))
+        return result.growth_rate
     
     
     def growth_comparison(self, area1, area2, year):
         
         # Compares the growth rate between two areas in a specific year.
-        growth1 = self.growth_calculator(area1, year)
-        growth2 = self.growth_calculator(area2, year)
-
-        if growth1 is not None and growth2 is not None:
-            if growth1 > growth2:
-                print(f"{area1} had a higher growth rate ({growth1:.2f}%) than {area2} ({growth2:.2f}%) in {year}.")
-            elif growth2 > growth1:
-                print(f"{area2} had a higher growth rate ({growth2:.2f}%) than {area1} ({growth1:.2f}%) in {year}.")
-            else:
-                print(f"{area1} and {area2} had the same growth rate ({growth1:.2f}%) in {year}.")
-        else:
-            print("Comparison could not be made due to insufficient data.")
+        result = self.growth_comparison_result(area1, area2, year)
+        print(render(result))
+        return result
 
     
     def growth_sort(self, year):
         
-        area_type = self.area_type()
-        
-        # Sorts the DataFrame by growth rate for a specific year and returns the sorted DataFrame.
-        
-        # Ensure the 'Growth Rate' column exists
-        if 'Growth Rate' not in self.data.columns:
-            self.data['Growth Rate'] = None
-
-        # Calculate growth rate for all areas for the specified year
-        areas = self.data[area_type.capitalize()].unique()
-        for area in areas:
-            self.growth_calculator(area, year)  # Updates the 'Growth Rate' column dynamically
-
-        # Filter rows for the specified year and sort by 'Growth Rate'
-        year_data = self.data[self.data['Year'] == year]
-        sorted_data = year_data.sort_values(by='Growth Rate', ascending=False)
-
-        print(f"{area_type.capitalize()}s sorted by growth rate in {year}:")
-        print(tabulate(sorted_data))
-
-        return sorted_data
+        # Sorts the areas by growth rate for a specific year and returns the sorted Ranking.
+        result = self.growth_sort_result(year)
+        print(render(result))
+        return result
 
 # subclass Continent inherits from Region
+@register
 class Continent(Region):
     
     def area_type(self):
@@ -278,33 +566,33 @@ def menu(region, continent):
                     else:
                         print("Invalid input. Please enter 'yes' or 'no'.")
 
-            def select_region_or_continent(entity, column_name):
-                """Helper function to select a region or continent by number."""
+            def select_region_or_continent(entity, names):
+                """Helper function to select a region or continent by number, from the names an instance keeps."""
                 print(f"\nAvailable {entity}s:")
-                for i, name in enumerate(column_name.unique(), 1):
+                for i, name in enumerate(names, 1):
                     print(f"{i}. {name}")
                 while True:
                     try:
                         choice = int(input(f"Select a {entity} by number: "))
-                        if choice < 1 or choice > len(column_name.unique()):
+                        if choice < 1 or choice > len(names):
                             print(f"Invalid choice. Please choose a valid {entity} number.")
                             continue
-                        return column_name.unique()[choice - 1]
+                        return names[choice - 1]
                     except ValueError:
                         print("Invalid input. Please enter a valid number.")
 
-            def select_year(column_name):
-                """Helper function to select a year by number."""
+            def select_year(years):
+                """Helper function to select a year by number, from the years an instance keeps."""
                 print("\nAvailable Years:")
-                for i, year in enumerate(column_name.unique(), 1):
+                for i, year in enumerate(years, 1):
                     print(f"{i}. {year}")
                 while True:
                     try:
                         year_choice = int(input("Select a year by number: "))
-                        if year_choice < 1 or year_choice > len(column_name.unique()):
+                        if year_choice < 1 or year_choice > len(years):
                             print("Invalid choice. Please choose a valid year number.")
                             continue
-                        return column_name.unique()[year_choice - 1]
+                        return years[year_choice - 1]
                     except ValueError:
                         print("Invalid input. Please enter a valid number.")
 
@@ -324,16 +612,16 @@ def menu(region, continent):
 
                     if sub_choice == 1:  # Regions
                         while True:
-                            area_name = select_region_or_continent("region", region['Region'])
-                            year = select_year(region['Year'])
+                            area_name = select_region_or_continent("region", region_instance.area_names)
+                            year = select_year(region_instance.years)
                             region_instance.display_population(area_name, year)
                             if not analyze_more():
                                 break
 
                     elif sub_choice == 2:  # Continents
                         while True:
-                            area_name = select_region_or_continent("continent", continent['Continent'])
-                            year = select_year(continent['Year'])
+                            area_name = select_region_or_continent("continent", continent_instance.area_names)
+                            year = select_year(continent_instance.years)
                             continent_instance.display_population(area_name, year)
                             if not analyze_more():
                                 break
@@ -356,18 +644,18 @@ def menu(region, continent):
 
                     if sub_choice == 1:  # Regions
                         while True:
-                            area_name1 = select_region_or_continent("region", region['Region'])
-                            area_name2 = select_region_or_continent("region", region['Region'])
-                            year = select_year(region['Year'])
+                            area_name1 = select_region_or_continent("region", region_instance.area_names)
+                            area_name2 = select_region_or_continent("region", region_instance.area_names)
+                            year = select_year(region_instance.years)
                             region_instance.population_comparison(area_name1, area_name2, year)
                             if not analyze_more():
                                 break
 
                     elif sub_choice == 2:  # Continents
                         while True:
-                            area_name1 = select_region_or_continent("continent", continent['Continent'])
-                            area_name2 = select_region_or_continent("continent", continent['Continent'])
-                            year = select_year(continent['Year'])
+                            area_name1 = select_region_or_continent("continent", continent_instance.area_names)
+                            area_name2 = select_region_or_continent("continent", continent_instance.area_names)
+                            year = select_year(continent_instance.years)
                             continent_instance.population_comparison(area_name1, area_name2, year)
                             if not analyze_more():
                                 break
@@ -389,10 +677,10 @@ def menu(region, continent):
                         continue
 
                     if sub_choice == 1:
-                        year = select_year(region['Year'])
+                        year = select_year(region_instance.years)
                         region_instance.population_sort(year)
                     elif sub_choice == 2:
-                        year = select_year(continent['Year'])
+                        year = select_year(continent_instance.years)
                         continent_instance.population_sort(year)
 
                     if not analyze_more():
@@ -413,12 +701,12 @@ def menu(region, continent):
                         continue
 
                     if sub_choice == 1:
-                        area_name = select_region_or_continent("region", region['Region'])
-                        year = select_year(region['Year'])
+                        area_name = select_region_or_continent("region", region_instance.area_names)
+                        year = select_year(region_instance.years)
                         region_instance.growth_calculator(area_name, year)
                     elif sub_choice == 2:
-                        area_name = select_region_or_continent("continent", continent['Continent'])
-                        year = select_year(continent['Year'])
+                        area_name = select_region_or_continent("continent", continent_instance.area_names)
+                        year = select_year(continent_instance.years)
                         continent_instance.growth_calculator(area_name, year)
 
                     if not analyze_more():
@@ -439,14 +727,14 @@ def menu(region, continent):
                         continue
 
                     if sub_choice == 1:
-                        area_name1 = select_region_or_continent("region", region['Region'])
-                        area_name2 = select_region_or_continent("region", region['Region'])
-                        year = select_year(region['Year'])
+                        area_name1 = select_region_or_continent("region", region_instance.area_names)
+                        area_name2 = select_region_or_continent("region", region_instance.area_names)
+                        year = select_year(region_instance.years)
                         region_instance.growth_comparison(area_name1, area_name2, year)
                     elif sub_choice == 2:
-                        area_name1 = select_region_or_continent("continent", continent['Continent'])
-                        area_name2 = select_region_or_continent("continent", continent['Continent'])
-                        year = select_year(continent['Year'])
+                        area_name1 = select_region_or_continent("continent", continent_instance.area_names)
+                        area_name2 = select_region_or_continent("continent", continent_instance.area_names)
+                        year = select_year(continent_instance.years)
                         continent_instance.growth_comparison(area_name1, area_name2, year)
 
                     if not analyze_more():
@@ -467,10 +755,10 @@ def menu(region, continent):
                         continue
 
                     if sub_choice == 1:
-                        year = select_year(region['Year'])
+                        year = select_year(region_instance.years)
                         region_instance.growth_sort(year)
                     elif sub_choice == 2:
-                        year = select_year(continent['Year'])
+                        year = select_year(continent_instance.years)
                         continent_instance.growth_sort(year)
 
                     if not analyze_more():
@@ -479,5 +767,20 @@ def menu(region, continent):
         except ValueError:
             print("Invalid input. Please enter a valid number.")
 
-menu(region, continent)
+def main(arguments=None):
+
+    # Loading the data from the local cache, which is only rebuilt when region.csv changed, or from the
+    # snapshots in --snapshot-dir, which are shared with the batch runner and the server
+    import argparse
+
+    from population_loader import load_data
+
+    parser = argparse.ArgumentParser(description="Explore the population of the continents and regions.")
+    parser.add_argument("--snapshot-dir", help="load the tables from the snapshots in this folder (built there when missing)")
+    arguments = parser.parse_args(arguments)
+
+    region, continent = load_data(snapshot_dir=arguments.snapshot_dir)
+    menu(region, continent)
 
+if __name__ == "__main__":
+    main()
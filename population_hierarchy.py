@@ -0,0 +1,227 @@
+"""
+The world -> continent -> subregion hierarchy of the population series.
+
+The hierarchy is read from a definition file (hierarchy.csv) with one row per population series:
+its series number in the source, its name, the series number of its parent and the table it
+belongs to (region or continent). Other hierarchies, like countries -> provinces -> districts,
+only need another definition file.
+
+The nodes are stored in integer arrays (parents, children and the order of a depth-first walk),
+so ancestor and descendant questions are answered in constant time, and totals can be added up
+from the subregions for the whole tree in one pass.
+"""
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+HIERARCHY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hierarchy.csv")
+
+
+class Hierarchy:
+    def __init__(self, series, names, parent_series, tables):
+
+        # Initialize the hierarchy with one entry per node. Nodes are numbered 0..n-1 in the given
+        # order, and parents are given by their series number (empty for the top of the hierarchy).
+        self.series = np.asarray(series, dtype=np.int64)
+        self.names = np.asarray(names, dtype=object)
+        self.tables = np.asarray(tables, dtype=object)
+        self.series_index = pd.Index(self.series)
+        if not self.series_index.is_unique:
+            raise ValueError("Every series number can only be used once in the hierarchy.")
+
+        parent_series = pd.to_numeric(pd.Series(parent_series), errors='coerce')
+        has_parent = parent_series.notna().to_numpy()
+        self.parents = np.full(len(self.series), -1, dtype=np.int64)
+        self.parents[has_parent] = self.series_index.get_indexer(parent_series[has_parent].astype(np.int64))
+        if (self.parents[has_parent] < 0).any():
+            raise ValueError("The hierarchy refers to a parent series that is not defined.")
+
+        # The children of every node, stored as one array with an offset per node
+        child_order = np.argsort(self.parents, kind='stable')
+        child_order = child_order[self.parents[child_order] >= 0]
+        self.child_nodes = child_order
+        self.child_offsets = np.zeros(len(self.series) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parents[child_order], minlength=len(self.series)), out=self.child_offsets[1:])
+
+        # Walk the tree depth first. The descendants of a node are then the nodes between its
+        # entry and exit position in the walk, which makes the queries below constant time.
+        order = []
+        self.depth = np.zeros(len(self.series), dtype=np.int64)
+        stack = list(np.flatnonzero(self.parents < 0)[::-1])
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            children = self.children(node)
+            self.depth[children] = self.depth[node] + 1
+            stack.extend(children[::-1].tolist())
+        if len(order) != len(self.series):
+            raise ValueError("The hierarchy contains a cycle.")
+
+        self.order = np.asarray(order, dtype=np.int64)
+        self.enter = np.empty(len(self.series), dtype=np.int64)
+        self.enter[self.order] = np.arange(len(self.order))
+        subtree_size = np.ones(len(self.series), dtype=np.int64)
+        for node in self.order[::-1]:
+            if self.parents[node] >= 0:
+                subtree_size[self.parents[node]] += subtree_size[node]
+        self.exit = self.enter + subtree_size
+
+    @classmethod
+    def from_csv(cls, path=HIERARCHY_FILE):
+
+        # Reads a definition file with the columns Series, Name, Parent and Table
+        definition = pd.read_csv(path)
+        return cls(definition['Series'], definition['Name'], definition['Parent'], definition['Table'])
+
+    def node(self, name, table=None):
+
+        # Returns the node number of an area. Names can be shared between tables
+        # (North America is both a region and a continent), so the table can be given too.
+        matches = self.names == name
+        if table is not None:
+            matches &= self.tables == table
+        nodes = np.flatnonzero(matches)
+        if len(nodes) != 1:
+            raise KeyError(f"{name} does not identify exactly one node in the hierarchy.")
+        return int(nodes[0])
+
+    def series_of(self, names, tables=None):
+
+        # Returns the series number of every area name, and -1 for names that are not in the hierarchy.
+        # tables can give the table of every name (empty where it is not known). Names that are used in
+        # more than one table, like North America, need their table, otherwise a ValueError is raised.
+        # Long tables repeat the same few (name, table) pairs in many rows, so the pairs are numbered
+        # first and only the distinct pairs are looked up.
+        name_codes, unique_names = pd.factorize(np.asarray(names, dtype=object))
+        if tables is None:
+            table_codes, unique_tables = np.full(len(name_codes), -1, dtype=np.int64), []
+        else:
+            table_codes, unique_tables = pd.factorize(np.asarray(tables, dtype=object))
+            unique_tables = [table if isinstance(table, str) else None for table in unique_tables]
+        pair_codes, pairs = pd.factorize(name_codes.astype(np.int64) * (len(unique_tables) + 1) + table_codes + 1)
+
+        by_table = {(name, table): series for name, table, series
+                    in zip(self.names.tolist(), self.tables.tolist(), self.series.tolist())}
+        shared = {name for name, count in Counter(self.names.tolist()).items() if count > 1}
+        by_name = {name: series for (name, _), series in by_table.items() if name not in shared}
+
+        pair_series = np.full(len(pairs), -1, dtype=np.int64)
+        ambiguous = set()
+        for number, pair in enumerate(pairs.tolist()):
+            name_code, table_code = divmod(pair, len(unique_tables) + 1)
+            if name_code < 0 or name_code >= len(unique_names):
+                continue
+            name = unique_names[name_code]
+            table = unique_tables[table_code - 1] if table_code > 0 else None
+            if table is not None:
+                pair_series[number] = by_table.get((name, table), -1)
+            elif name in shared:
+                ambiguous.add(name)
+            else:
+                pair_series[number] = by_name.get(name, -1)
+        if ambiguous:
+            raise ValueError(f"These names are used in more than one table, give their table too: {sorted(ambiguous)}")
+        return pair_series[pair_codes]
+
+    def children(self, node):
+
+        # Returns the direct children of a node
+        return self.child_nodes[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def descendants(self, node):
+
+        # Returns every node below a node, as a slice of the depth-first walk
+        return self.order[self.enter[node] + 1:self.exit[node]]
+
+    def ancestors(self, node):
+
+        # Returns the nodes above a node, starting with its parent
+        ancestors = []
+        node = self.parents[node]
+        while node >= 0:
+            ancestors.append(int(node))
+            node = self.parents[node]
+        return ancestors
+
+    def is_ancestor(self, ancestor, node):
+
+        # Checks if a node lies below another node in the hierarchy
+        return bool(self.enter[ancestor] < self.enter[node] < self.exit[ancestor])
+
+    def is_leaf(self):
+
+        # Returns a boolean array that is True for the nodes without children
+        return self.child_offsets[1:] == self.child_offsets[:-1]
+
+    def roll_up(self, values):
+
+        # Adds up the values of the lowest level nodes (the subregions) for every node in the hierarchy.
+        # values has one row per node, optionally with a column per year. Nodes with children get the
+        # sum of the lowest level nodes below them, and NaN if any of those values is missing.
+        values = np.asarray(values, dtype=np.float64)
+        leaf_values = np.where(self.is_leaf().reshape((-1,) + (1,) * (values.ndim - 1)), values, 0)[self.order]
+        missing = np.isnan(leaf_values)
+
+        zeros = np.zeros((1,) + values.shape[1:])
+        total = np.concatenate([zeros, np.cumsum(np.where(missing, 0, leaf_values), axis=0)])
+        missing_count = np.concatenate([zeros, np.cumsum(missing, axis=0)])
+
+        rolled_up = total[self.exit] - total[self.enter]
+        rolled_up[(missing_count[self.exit] - missing_count[self.enter]) > 0] = np.nan
+        return rolled_up
+
+    def update_roll_up(self, rolled_up, values, columns):
+
+        # Adds up the values again for some year columns only, after values in those years changed,
+        # and writes the result into rolled_up (a node-by-year matrix made by roll_up) in place
+        columns = np.asarray(columns, dtype=np.int64)
+        if len(columns):
+            rolled_up[:, columns] = self.roll_up(np.asarray(values, dtype=np.float64)[:, columns])
+        return rolled_up
+
+    def population_matrix(self, *tables):
+
+        # Builds a node-by-year matrix with the populations from the cleaned tables (using their Region_nr)
+        data = pd.concat([table[['Region_nr', 'Year', 'Population']] for table in tables], ignore_index=True)
+        years = np.sort(data['Year'].unique())
+        matrix = np.full((len(self.series), len(years)), np.nan)
+        nodes = self.series_index.get_indexer(data['Region_nr'])
+        known = nodes >= 0
+        matrix[nodes[known], np.searchsorted(years, data['Year'].to_numpy()[known])] = data['Population'].to_numpy()[known]
+        return matrix, years
+
+    def check_totals(self, *tables, tolerance=0.001):
+
+        # Compares the reported totals of the continents (and the world) with the sum of their subregions.
+        # Returns the node, year combinations where the relative difference is larger than the tolerance.
+        matrix, years = self.population_matrix(*tables)
+        rolled_up = self.roll_up(matrix)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            difference = (matrix - rolled_up) / matrix
+        nodes, columns = np.nonzero(np.abs(difference) > tolerance)
+        return pd.DataFrame({
+            'Name': self.names[nodes],
+            'Table': self.tables[nodes],
+            'Year': years[columns],
+            'Reported': matrix[nodes, columns],
+            'Rolled up': rolled_up[nodes, columns],
+        })
+
+    def split(self, data):
+
+        # Splits a table with a Region_nr column into one DataFrame per table in the hierarchy,
+        # with the area names in a column named after the table ('Region', 'Continent', ...)
+        nodes = self.series_index.get_indexer(data['Region_nr'])
+        if (nodes < 0).any():
+            unknown = sorted(set(data['Region_nr'][nodes < 0]))
+            raise ValueError(f"The data contains series that are not in the hierarchy: {unknown}")
+
+        tables = {}
+        for table in pd.unique(self.tables):
+            rows = self.tables[nodes] == table
+            part = data[rows].copy()
+            part[table.capitalize()] = self.names[nodes[rows]]
+            tables[table] = part
+        return tables
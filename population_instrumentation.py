@@ -0,0 +1,266 @@
+"""
+Timers, counters and optional profiling for loading, cleaning, the queries and rendering.
+
+Instrumentation is switched off by default. It is switched on with enable(), or by setting the
+environment variable POPULATION_INSTRUMENTATION=1 (POPULATION_PROFILE=1 and POPULATION_MEMORY=1 also
+switch on cProfile and tracemalloc capture). When it is on:
+
+- every method of the registered classes (Region and Continent) counts its calls and keeps a
+  latency histogram, named like "Continent.display_population",
+- the stages of loading and cleaning, and the rendering of results, are timed the same way,
+- capture() blocks record a cProfile report and/or the peak memory when those switches are on.
+
+The methods are only wrapped while instrumentation is on, so switched off they run exactly as
+before, and stage() then returns one shared object that does nothing.
+The numbers can be exported as JSON or in the Prometheus text format. The profiling and export
+modules are only imported when they are used, so importing this module stays cheap.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+settings = {"enabled": False, "profile": False, "memory": False}
+
+
+class Histogram:
+    __slots__ = ("count", "total", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        # One bucket per bound, and one for everything above the last bound
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.memory_peaks = {}
+            self.profiles = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "timers": {name: {"count": histogram.count, "total_seconds": histogram.total,
+                                  "mean_seconds": histogram.total / histogram.count if histogram.count else 0.0,
+                                  "max_seconds": histogram.maximum,
+                                  "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], histogram.buckets))}
+                           for name, histogram in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "memory_peak_bytes": dict(sorted(self.memory_peaks.items())),
+                "profiles": dict(sorted(self.profiles.items())),
+            }
+
+    def to_json(self):
+        import json
+
+        return json.dumps(self.to_dict(), indent=1)
+
+    def to_prometheus(self):
+
+        # Returns the metrics in the Prometheus text format, with cumulative histogram buckets
+        with self.lock:
+            lines = ["# HELP population_call_seconds Latency of instrumented methods and stages.",
+                     "# TYPE population_call_seconds histogram"]
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([repr(bound) for bound in BUCKETS] + ["+Inf"], histogram.buckets):
+                    cumulative += count
+                    lines.append(f'population_call_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'population_call_seconds_sum{{name="{name}"}} {histogram.total!r}')
+                lines.append(f'population_call_seconds_count{{name="{name}"}} {histogram.count}')
+
+            lines += ["# HELP population_events_total Number of counted events.",
+                      "# TYPE population_events_total counter"]
+            lines += [f'population_events_total{{name="{name}"}} {count}' for name, count in sorted(self.counters.items())]
+
+            lines += ["# HELP population_memory_peak_bytes Peak memory of captured blocks.",
+                      "# TYPE population_memory_peak_bytes gauge"]
+            lines += [f'population_memory_peak_bytes{{name="{name}"}} {peak}' for name, peak in sorted(self.memory_peaks.items())]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Stage:
+    # Times a block of code as one observation of a named timer
+    __slots__ = ("name", "begin")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        metrics.observe(self.name, time.perf_counter() - self.begin)
+        return False
+
+
+class NullStage:
+    # Used instead of Stage when instrumentation is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+null_stage = NullStage()
+
+
+def stage(name):
+
+    # Returns a context manager that times a stage, like: with stage("load.read_tables"): ...
+    if not settings["enabled"]:
+        return null_stage
+    return Stage(name)
+
+
+def increment(name, amount=1):
+
+    # Counts an event, like a cache hit, when instrumentation is on
+    if settings["enabled"]:
+        metrics.increment(name, amount)
+
+
+class capture:
+    # Records a cProfile report and/or the peak memory of a block, when profiling or memory capture is on
+
+    def __init__(self, name):
+        self.name = name
+        self.profiler = None
+        self.started_tracing = False
+
+    def __enter__(self):
+        if settings["memory"]:
+            import tracemalloc
+
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if settings["profile"]:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exception):
+        if self.profiler is not None:
+            import io
+            import pstats
+
+            self.profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(self.profiler, stream=report).sort_stats("cumulative").print_stats(30)
+            with metrics.lock:
+                metrics.profiles[self.name] = report.getvalue()
+        if settings["memory"]:
+            import tracemalloc
+
+            peak = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+            with metrics.lock:
+                metrics.memory_peaks[self.name] = max(metrics.memory_peaks.get(self.name, 0), peak)
+        return False
+
+
+# Classes whose methods are timed, and the original methods while they are wrapped
+registered_classes = []
+original_methods = {}
+
+
+def timed_method(name, function):
+
+    @functools.wraps(function)
+    def timed(self, *args, **kwargs):
+        begin = time.perf_counter()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            metrics.observe(f"{type(self).__name__}.{name}", time.perf_counter() - begin)
+    return timed
+
+
+def wrap_class(cls):
+
+    # Replaces the public methods defined in the class itself with timed versions
+    for name, value in list(vars(cls).items()):
+        if name.startswith("_") or not callable(value) or (cls, name) in original_methods:
+            continue
+        original_methods[cls, name] = value
+        setattr(cls, name, timed_method(name, value))
+
+
+def register(cls):
+
+    # Class decorator that makes the methods of a class instrumented while instrumentation is on
+    registered_classes.append(cls)
+    if settings["enabled"]:
+        wrap_class(cls)
+    return cls
+
+
+def enable(profile=False, memory=False):
+
+    # Switches instrumentation on, optionally with cProfile reports and memory peaks for capture() blocks
+    settings.update(enabled=True, profile=profile, memory=memory)
+    for cls in registered_classes:
+        wrap_class(cls)
+
+
+def disable():
+
+    # Switches instrumentation off and puts the original methods back. The collected metrics are kept.
+    settings.update(enabled=False, profile=False, memory=False)
+    for (cls, name), function in list(original_methods.items()):
+        setattr(cls, name, function)
+    original_methods.clear()
+
+
+def write_metrics(path):
+
+    # Writes the metrics to a file, in the Prometheus format for .prom and .txt files and as JSON otherwise
+    text = metrics.to_prometheus() if path.endswith((".prom", ".txt")) else metrics.to_json()
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+if os.environ.get("POPULATION_INSTRUMENTATION") == "1":
+    enable(profile=os.environ.get("POPULATION_PROFILE") == "1", memory=os.environ.get("POPULATION_MEMORY") == "1")
@@ -0,0 +1,427 @@
+"""
+Loading of the region and continent tables.
+
+The raw population tables can come from different sources: the Wikipedia page, a saved copy of
+the page, the bundled region.csv, or many local files like CSV exports, saved HTML pages and
+Excel files. Whatever the source is, the tables are cleaned the same way and the result is kept in a local cache. The cache is only
+rebuilt when the content of the source or of the hierarchy file changes, so normally loading is just reading one file.
+The cleaned tables are stored compactly: area names as categories, years and series numbers as int16,
+populations as int64 and the '±% p.a.' column as floats.
+
+Population series are recognized by their headers (a year and a population column), not by their
+position in a file, so extra tables on a page or in a file are skipped. Local files are parsed by a
+pool of threads or processes, and the parsed tables of every file are cached by the hash of its content.
+Areas that are not in the hierarchy are an error, so a changed page or a file with other names can
+not silently give wrong tables. With drop_unknown (--drop-unknown) their rows are left out instead.
+
+    python population_loader.py sources/ --workers 8
+"""
+import argparse
+import hashlib
+import io
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from population_hierarchy import HIERARCHY_FILE, Hierarchy
+from population_instrumentation import capture, increment, stage
+from population_storage import fits_in, parse_growth_strings, write_atomic, year_column
+
+# Folder with the bundled CSV files and the default location of the cache
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(DATA_DIR, ".population_cache")
+CACHE_FILE = "tables.pkl"
+
+# Increase this number when the cleaning below changes, so old caches are rebuilt
+CACHE_VERSION = 6
+
+WIKIPEDIA_URL = "https://en.wikipedia.org/wiki/List_of_continents_and_continental_subregions_by_population"
+
+# Headers (in lower case) that are recognized, and the column they are turned into. Tables with a
+# Name column get their series from the hierarchy by name, the Table column says in which table to look.
+# A Region or Continent header also says the table.
+HEADER_ALIASES = {
+    'year': 'Year', 'time': 'Year',
+    'pop.': 'Pop.', 'pop': 'Pop.', 'population': 'Pop.', 'poptotal': 'Pop.',
+    '±% p.a.': '±% p.a.', '% p.a.': '±% p.a.',
+    'region': 'Name', 'continent': 'Name', 'location': 'Name', 'name': 'Name', 'area': 'Name',
+    'table': 'Table',
+}
+
+# Population headers with another unit than people, like the UN World Population Prospects (in thousands)
+POPULATION_SCALES = {'poptotal': 1000}
+
+# Types of local files that can be read, and how their tables are read
+SOURCE_READERS = {
+    '.csv': lambda path: [pd.read_csv(path)],
+    '.htm': pd.read_html,
+    '.html': pd.read_html,
+    '.xls': lambda path: list(pd.read_excel(path, sheet_name=None).values()),
+    '.xlsx': lambda path: list(pd.read_excel(path, sheet_name=None).values()),
+}
+
+
+def hash_files(paths):
+    """Helper function that returns one content hash for a list of files."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def to_number(values):
+    """Helper function that turns a column with numbers as text, like "1,234,567[3]", into numbers (NaN if it fails)."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    text = values.astype(str).str.replace(r'\[.*?\]|,', '', regex=True).str.strip()
+    return pd.to_numeric(text, errors='coerce')
+
+
+def recognize_table(table):
+
+    # Returns a population series in the standard form (Year, Pop., and '±% p.a.', Name and Table when the
+    # table has them), or None when the headers are not those of a population series.
+    # Headers with several levels, like the ones read_html can make, match when one of the levels matches.
+    columns = {}
+    table_name = None
+    scale = 1
+    for column in table.columns:
+        parts = [str(part).strip() for part in (column if isinstance(column, tuple) else (column,))]
+        for part in parts:
+            standard = HEADER_ALIASES.get(part.lower())
+            if standard is not None and standard not in columns:
+                columns[standard] = column
+                if standard == 'Name' and part.lower() in ('region', 'continent'):
+                    table_name = part.lower()
+                if standard == 'Pop.':
+                    scale = POPULATION_SCALES.get(part.lower(), 1)
+                break
+    if 'Year' not in columns or 'Pop.' not in columns:
+        return None
+
+    result = pd.DataFrame({standard: table[column] for standard, column in columns.items()})
+    if table_name is not None and 'Table' not in result.columns:
+        result['Table'] = table_name
+    result['Year'] = to_number(result['Year'])
+    result['Pop.'] = to_number(result['Pop.'])
+    result = result.dropna(subset=['Year', 'Pop.'])
+    result['Year'] = result['Year'].astype(np.int64)
+    result['Pop.'] = (result['Pop.'] * scale).round().astype(np.int64) if scale != 1 else result['Pop.'].astype(np.int64)
+    return result.reset_index(drop=True)
+
+
+def recognize_tables(tables):
+
+    # Returns the population series among a list of tables, in their order
+    recognized = [recognize_table(table) for table in tables]
+    return [table for table in recognized if table is not None]
+
+
+def parse_file(path):
+
+    # Reads every table of one local file and returns the population series among them
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SOURCE_READERS:
+        raise ValueError(f"Unknown type of source file: {path}")
+    return recognize_tables(SOURCE_READERS[extension](path))
+
+
+class WikipediaSource:
+    # Downloads the page from Wikipedia. Only usable on machines with internet access.
+
+    def __init__(self, url=WIKIPEDIA_URL):
+        self.url = url
+        self.html = None
+
+    def fingerprint(self):
+
+        # The page has to be downloaded to know if it changed, but it is kept for read_tables
+        from urllib.request import urlopen
+
+        with urlopen(self.url) as response:
+            self.html = response.read()
+        return hashlib.sha256(self.html).hexdigest()
+
+    def read_tables(self):
+
+        if self.html is None:
+            self.fingerprint()
+        return recognize_tables(pd.read_html(io.StringIO(self.html.decode("utf-8"))))
+
+
+class HtmlSnapshotSource:
+    # Reads a copy of the Wikipedia page that was saved to disk.
+
+    def __init__(self, path):
+        self.path = path
+
+    def fingerprint(self):
+        return hash_files([self.path])
+
+    def read_tables(self):
+        return parse_file(self.path)
+
+
+class CsvSource:
+    # Reads the raw region table (Year, Pop., ±% p.a.) that was saved as a CSV file.
+
+    def __init__(self, path=os.path.join(DATA_DIR, "region.csv")):
+        self.path = path
+
+    def fingerprint(self):
+        return hash_files([self.path])
+
+    def read_tables(self):
+        return parse_file(self.path)
+
+
+class LocalFilesSource:
+    # Reads the population series of many local files, in the given order. The files are hashed and
+    # parsed by a pool of threads (or processes, which is faster for HTML pages), and the parsed tables
+    # of every file are cached by its hash, so only new or changed files are parsed again.
+
+    def __init__(self, paths, workers=None, processes=False, cache_dir=None):
+
+        # cache_dir is the folder for the parsed files. By default it is the files folder inside the
+        # cache folder of load_tables.
+        self.paths = list(paths)
+        self.workers = workers
+        self.processes = processes
+        self.cache_dir = cache_dir
+        self.file_hashes = None
+
+    def file_paths(self):
+        return self.paths
+
+    def fingerprint(self):
+
+        # The hashes are kept for read_tables, which uses them as the keys of the cached files
+        paths = self.file_paths()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            self.file_hashes = dict(zip(paths, pool.map(lambda path: hash_files([path]), paths)))
+        return hashlib.sha256("".join(self.file_hashes[path] for path in paths).encode()).hexdigest()
+
+    def read_tables(self, cache_dir=None):
+
+        # cache_dir is only used when the source has no cache folder of its own, load_tables passes its own
+        paths = self.file_paths()
+        if self.file_hashes is None or set(self.file_hashes) != set(paths):
+            self.fingerprint()
+        cache_dir = self.cache_dir or cache_dir or os.path.join(CACHE_DIR, "files")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        parsed = {}
+        missing = []
+        for path in paths:
+            cache_path = os.path.join(cache_dir, f"{CACHE_VERSION}-{self.file_hashes[path]}.pkl")
+            if os.path.exists(cache_path):
+                with open(cache_path, "rb") as file:
+                    parsed[path] = pickle.load(file)
+            else:
+                missing.append((path, cache_path))
+        increment("load.file_cache_hit", len(paths) - len(missing))
+        increment("load.file_cache_miss", len(missing))
+
+        if missing:
+            executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            with stage("load.parse_files"), executor(max_workers=self.workers) as pool:
+                for (path, cache_path), tables in zip(missing, pool.map(parse_file, [path for path, _ in missing])):
+                    parsed[path] = tables
+
+                    def write_tables(temporary_path):
+                        with open(temporary_path, "wb") as file:
+                            pickle.dump(tables, file)
+
+                    write_atomic(cache_path, write_tables)
+        return [table for path in paths for table in parsed[path]]
+
+
+class FixtureDirectorySource(LocalFilesSource):
+    # Reads the source files (CSV, HTML and Excel files) in a directory, in the order of the file names.
+
+    def __init__(self, directory, workers=None, processes=False, cache_dir=None):
+        super().__init__([], workers, processes, cache_dir)
+        self.directory = directory
+
+    def file_paths(self):
+        names = sorted(name for name in os.listdir(self.directory) if os.path.splitext(name)[1].lower() in SOURCE_READERS)
+        return [os.path.join(self.directory, name) for name in names]
+
+
+def split_tables(region_tables, hierarchy, drop_unknown=False):
+
+    # When extracting data from the Wikipedia page, the data is unstructured and needs to be cleaned
+    # Table for all regions
+    with stage("clean.concat"):
+        lengths = np.array([len(table) for table in region_tables], dtype=np.int64)
+        data = pd.concat(region_tables, ignore_index=True) if region_tables else pd.DataFrame(columns=['Year', 'Pop.'])
+
+        # Renaming the columns to make them identical
+        data = data.rename(columns={'Pop.': 'Population'})
+
+    # Tables with area names get their Region_nr from the hierarchy. The other tables do not have a
+    # region name but just Year and Population. Every table starts a new series, and within a table
+    # every series starts with a year that is not later than the last year of the series before it,
+    # so each new start gets the next Region_nr. The names, and whether a series is a region or a
+    # continent, come from the hierarchy.
+    with stage("clean.number_series"):
+        table_start = np.zeros(len(data), dtype=bool)
+        table_start[(np.cumsum(lengths) - lengths)[lengths > 0]] = True
+        named = data['Name'].notna().to_numpy() if 'Name' in data.columns else np.zeros(len(data), dtype=bool)
+        series_start = ~named & (table_start | (data['Year'].diff() <= 0).to_numpy())
+
+        region_numbers = np.cumsum(series_start)
+        if named.any():
+            tables = data['Table'][named] if 'Table' in data.columns else None
+            region_numbers[named] = hierarchy.series_of(data['Name'][named], tables)
+
+        # Names and series numbers that are not in the hierarchy would silently give wrong or empty
+        # tables, so they are an error unless drop_unknown is set, which leaves their rows out
+        unknown = hierarchy.series_index.get_indexer(region_numbers) < 0
+        if unknown.any() and not drop_unknown:
+            names = sorted(set(data['Name'][unknown & named].astype(str))) if named.any() else []
+            series = sorted(set(region_numbers[unknown & ~named].tolist()))
+            raise ValueError(f"These areas are not in the hierarchy: {names + [f'series {number}' for number in series]}")
+        data['Region_nr'] = region_numbers
+        data = data[~unknown].drop(columns=[column for column in ('Name', 'Table') if column in data.columns])
+
+    with stage("clean.split"):
+        tables = hierarchy.split(data)
+
+    with stage("clean.compact"):
+        return {table: compact_table(part, table.capitalize()) for table, part in tables.items()}
+
+
+def compact_table(table, area_column):
+
+    # Stores the columns of a cleaned table compactly. The area names become categories (a small integer
+    # code per row and one copy of every name, in the order they appear), the years int16, the series
+    # numbers int16 (int32 for very large hierarchies), the populations int64 and the '±% p.a.' strings
+    # like "+2.21%" floats. The row labels become a range, which takes no memory per row.
+    years = year_column(table['Year'])
+    table = table.reset_index(drop=True)
+    table[area_column] = pd.Categorical(table[area_column], categories=pd.unique(table[area_column]))
+    table['Year'] = years
+    table['Population'] = table['Population'].to_numpy(dtype=np.int64)
+    if 'Region_nr' in table.columns:
+        series = table['Region_nr'].to_numpy(dtype=np.int64)
+        table['Region_nr'] = series.astype(np.int16 if fits_in(series, np.int16) else np.int32)
+    if '±% p.a.' in table.columns:
+        table['±% p.a.'] = parse_growth_strings(table['±% p.a.'])
+    return table
+
+
+def clean_tables(region_tables, hierarchy=None, drop_unknown=False):
+
+    # Returns the cleaned (region, continent) DataFrames
+    if hierarchy is None:
+        hierarchy = Hierarchy.from_csv()
+    tables = split_tables(region_tables, hierarchy, drop_unknown)
+    return tables['region'], tables['continent']
+
+
+def load_tables(source=None, hierarchy_path=HIERARCHY_FILE, cache_dir=CACHE_DIR, export_dir=None, drop_unknown=False):
+
+    # Returns the cleaned tables as a dictionary with one DataFrame per table in the hierarchy.
+    # The bundled region.csv is used when no source is given, so nothing is downloaded by default.
+    # The tables are only parsed and cleaned again when the content of the source or the hierarchy changed.
+    # When export_dir is given, region.csv and continent.csv are written there after a rebuild.
+    # Areas that are not in the hierarchy raise a ValueError, unless drop_unknown is set (see split_tables).
+    if source is None:
+        source = CsvSource()
+
+    with capture("load_tables"), stage("load.total"):
+        with stage("load.fingerprint"):
+            fingerprint = (f"{CACHE_VERSION}:{type(source).__name__}:{source.fingerprint()}:{hash_files([hierarchy_path])}"
+                           f":{drop_unknown}")
+        cache_path = os.path.join(cache_dir, CACHE_FILE)
+
+        if os.path.exists(cache_path):
+            with stage("load.cache_read"):
+                with open(cache_path, "rb") as file:
+                    cached = pickle.load(file)
+            if cached["fingerprint"] == fingerprint:
+                increment("load.cache_hit")
+                return cached["tables"]
+        increment("load.cache_miss")
+
+        with stage("load.read_tables"):
+            if isinstance(source, LocalFilesSource):
+                # The parsed files are cached next to the cleaned tables
+                region_tables = source.read_tables(os.path.join(cache_dir, "files"))
+            else:
+                region_tables = source.read_tables()
+        with stage("load.clean"):
+            tables = split_tables(region_tables, Hierarchy.from_csv(hierarchy_path), drop_unknown)
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        def write_cache(path):
+            with open(path, "wb") as file:
+                pickle.dump({"fingerprint": fingerprint, "tables": tables}, file)
+
+        with stage("load.cache_write"):
+            write_atomic(cache_path, write_cache)
+
+        if export_dir is not None:
+            # Saving the raw region table and the continent DataFrame
+            with stage("load.export"):
+                write_atomic(os.path.join(export_dir, "region.csv"),
+                             lambda path: pd.concat(region_tables, ignore_index=True).to_csv(path, index=False))
+                if "continent" in tables:
+                    write_atomic(os.path.join(export_dir, "continent.csv"),
+                                 lambda path: tables["continent"].to_csv(path, index=False))
+
+        return tables
+
+
+def load_data(source=None, hierarchy_path=HIERARCHY_FILE, cache_dir=CACHE_DIR, export_dir=None, drop_unknown=False,
+              snapshot_dir=None):
+
+    # Returns the cleaned (region, continent) DataFrames, see load_tables. With a snapshot_dir they are
+    # read from the memory-mapped snapshots in that folder instead, so every process started with the
+    # same folder shares one copy of the tables. Missing snapshots are built from the other arguments
+    # first; existing ones are used as they are, population_update.py adds new rows to them.
+    if snapshot_dir is not None:
+        from population_snapshot import has_snapshots, read_snapshots, write_snapshots
+
+        if not has_snapshots(snapshot_dir):
+            write_snapshots(*load_data(source, hierarchy_path, cache_dir, export_dir, drop_unknown), snapshot_dir)
+        return read_snapshots(snapshot_dir)
+    tables = load_tables(source, hierarchy_path, cache_dir, export_dir, drop_unknown)
+    return tables["region"], tables["continent"]
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Read population tables from local files and clean them.")
+    parser.add_argument("paths", nargs="+", help="CSV, HTML or Excel files, or directories with such files")
+    parser.add_argument("--workers", type=int, help="number of threads or processes that parse the files")
+    parser.add_argument("--processes", action="store_true", help="parse the files in processes instead of threads")
+    parser.add_argument("--hierarchy", default=HIERARCHY_FILE)
+    parser.add_argument("--export-dir", help="write region.csv and continent.csv to this folder")
+    parser.add_argument("--drop-unknown", action="store_true", help="leave out areas that are not in the hierarchy")
+    arguments = parser.parse_args(arguments)
+
+    # Directories are replaced by their source files, in the order of the file names
+    paths = []
+    for path in arguments.paths:
+        if os.path.isdir(path):
+            paths += FixtureDirectorySource(path).file_paths()
+        else:
+            paths.append(path)
+
+    source = LocalFilesSource(paths, arguments.workers, arguments.processes)
+    tables = load_tables(source, arguments.hierarchy, export_dir=arguments.export_dir, drop_unknown=arguments.drop_unknown)
+    for table, data in tables.items():
+        print(f"{table}: {len(data)} rows, {data[table.capitalize()].nunique()} areas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Load test for the query server.
+
+Starts a server on a free local port (or uses a running one with --url), sends queries from several
+client threads and reports the latency percentiles and the number of requests per second.
+
+    python population_loadtest.py --clients 8 --requests 2000
+    python population_loadtest.py --url http://127.0.0.1:8000 --batch-size 100
+    python population_loadtest.py --clients 16 --workers 2 --idle-clients 8
+
+The last example runs more clients than workers while some connections stay open without sending
+anything, which checks that idle keep-alive connections don't hold on to the workers.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from population_loader import load_data
+from population_server import start_server
+
+OPERATIONS = ["display_population", "population_comparison", "population_sort",
+              "growth_calculator", "growth_comparison", "growth_sort"]
+
+
+def make_queries(region, continent, count, seed=0):
+
+    # Makes random queries over the areas and years in the data
+    generator = random.Random(seed)
+    choices = {
+        "region": (region['Region'].unique().tolist(), region['Year'].unique().tolist()),
+        "continent": (continent['Continent'].unique().tolist(), continent['Year'].unique().tolist()),
+    }
+    queries = []
+    for _ in range(count):
+        area_type = generator.choice(["region", "continent"])
+        areas, years = choices[area_type]
+        queries.append({"operation": generator.choice(OPERATIONS), "type": area_type,
+                        "area": generator.choice(areas), "area2": generator.choice(areas),
+                        "year": int(generator.choice(years))})
+    return queries
+
+
+def run_client(host, port, queries, batch_size, latencies, errors):
+
+    # Sends the queries over one kept-alive connection and records the latency of every request
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        for start in range(0, len(queries), batch_size):
+            begin = time.perf_counter()
+            try:
+                if batch_size == 1:
+                    connection.request("GET", "/query?" + urlencode(queries[start]))
+                else:
+                    body = json.dumps(queries[start:start + batch_size])
+                    connection.request("POST", "/batch", body=body, headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as error:
+                # Refused or dropped connections count as errors, and the client connects again
+                errors.append(type(error).__name__)
+                connection.close()
+                continue
+            latencies.append(time.perf_counter() - begin)
+            if response.status != 200:
+                errors.append(response.status)
+                if response.will_close:
+                    connection.close()
+    finally:
+        connection.close()
+
+
+def open_idle_connections(host, port, count):
+
+    # Opens connections that send one request and then stay open without sending anything, like
+    # dashboards and browser tabs. They should not slow down the other clients.
+    connections = []
+    for _ in range(count):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        connection.request("GET", "/health")
+        connection.getresponse().read()
+        connections.append(connection)
+    return connections
+
+
+def load_test(host, port, queries, clients=8, batch_size=1, idle_clients=0):
+
+    # Splits the queries over the clients, runs them at the same time and returns the statistics.
+    # The idle clients stay connected during the test without sending requests.
+    latencies = []
+    errors = []
+    idle_connections = open_idle_connections(host, port, idle_clients)
+    threads = [threading.Thread(target=run_client, args=(host, port, queries[number::clients], batch_size, latencies, errors))
+               for number in range(clients)]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - begin
+    for connection in idle_connections:
+        connection.close()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "queries": len(queries),
+        "errors": len(errors),
+        "seconds": duration,
+        "requests_per_second": len(latencies) / duration,
+        "queries_per_second": len(queries) / duration,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Load test the population query server.")
+    parser.add_argument("--url", help="address of a running server, by default a local server is started")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="number of queries to send")
+    parser.add_argument("--batch-size", type=int, default=1, help="queries per request, more than 1 uses /batch")
+    parser.add_argument("--workers", type=int, default=8, help="worker threads of the local server")
+    parser.add_argument("--snapshot-dir", help="load the tables from the snapshots in this folder (built there when missing)")
+    parser.add_argument("--idle-clients", type=int, default=0, help="kept-alive connections that stay idle during the test")
+    arguments = parser.parse_args(arguments)
+
+    region, continent = load_data(snapshot_dir=arguments.snapshot_dir)
+    queries = make_queries(region, continent, arguments.requests)
+
+    server = None
+    if arguments.url:
+        url = urlsplit(arguments.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        server = start_server(region, continent, workers=arguments.workers)
+        host, port = server.server_address[:2]
+
+    try:
+        statistics = load_test(host, port, queries, arguments.clients, arguments.batch_size, arguments.idle_clients)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print(f"{statistics['requests']} requests ({statistics['queries']} queries) in {statistics['seconds']:.2f} s, "
+          f"{statistics['errors']} errors")
+    print(f"Requests per second: {statistics['requests_per_second']:.0f}, queries per second: {statistics['queries_per_second']:.0f}")
+    print(f"Latency p50: {statistics['p50_ms']:.2f} ms, p99: {statistics['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
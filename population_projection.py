@@ -0,0 +1,171 @@
+"""
+Monte Carlo projections of the future population.
+
+Every lowest level area of the hierarchy (the subregions, and continents without subregions) gets
+thousands of simulated trajectories of annual growth rates, based on the growth rates in its
+history. The trajectories are added up through the hierarchy to continents and the world, and
+summarized as quantiles per area and year.
+
+The trajectories are split into fixed chunks that are simulated by a pool of processes. Every chunk
+has its own random seed derived from one seed, so the result only depends on the seed and not on the
+number of processes. The processes write their results straight into one shared memory array, and
+then calculate the quantiles from it, a few areas per process.
+
+    python population_projection.py --trajectories 10000 --horizon 30 --workers 4
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from population_hierarchy import Hierarchy
+
+# Settings of the worker processes, set once per process by init_worker
+worker_settings = {}
+
+
+def growth_parameters(hierarchy, region, continent, history=3):
+
+    # Returns the base year, and for every node the population in that year, the mean annual growth
+    # rate over the last `history` stretches between recorded years, and the spread of those rates
+    matrix, years = hierarchy.population_matrix(region, continent)
+    leaves = hierarchy.is_leaf()
+
+    # The base year is the last year where every lowest level area has data
+    complete = np.flatnonzero(~np.isnan(matrix[leaves]).any(axis=0))
+    if len(complete) == 0:
+        raise ValueError("There is no year with data for every area.")
+    base = complete[-1]
+    recorded = complete[complete <= base]
+
+    # Annual growth rates between the recorded years, like the CAGR in population_timeseries
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stretch_years = np.diff(years[recorded]).astype(np.float64)
+        rates = np.power(matrix[:, recorded[1:]] / matrix[:, recorded[:-1]], 1 / stretch_years) - 1
+    recent = rates[:, -history:] if rates.shape[1] else np.zeros((len(matrix), 1))
+    mean_rates = np.nan_to_num(np.nanmean(recent, axis=1)) if recent.size else np.zeros(len(matrix))
+    volatility = np.nan_to_num(np.nanstd(rates, axis=1)) if rates.size else np.zeros(len(matrix))
+    return int(years[base]), matrix[:, base], mean_rates, volatility
+
+
+def init_worker(settings):
+    worker_settings.update(settings)
+
+
+def simulate_chunk(first, last, seed_sequence):
+
+    # Simulates trajectories first..last-1 and writes them, added up through the hierarchy, into the shared array
+    settings = worker_settings
+    hierarchy = settings["hierarchy"]
+    leaves = np.flatnonzero(hierarchy.is_leaf())
+    horizon = settings["horizon"]
+    count = last - first
+    generator = np.random.default_rng(seed_sequence)
+
+    mean = settings["mean_rates"][leaves][None, :]
+    spread = settings["volatility"][leaves][None, :] * settings["volatility_scale"]
+    persistence = settings["persistence"]
+
+    # Growth rate paths: the mean rate plus noise, which carries over from year to year with the given persistence
+    noise = generator.standard_normal((count, len(leaves), horizon))
+    rates = np.empty_like(noise)
+    deviation = np.zeros((count, len(leaves)))
+    innovation_scale = np.sqrt(1 - persistence ** 2)
+    for year in range(horizon):
+        deviation = persistence * deviation + innovation_scale * spread * noise[:, :, year]
+        rates[:, :, year] = mean + deviation
+
+    node_values = np.zeros((len(hierarchy.series), count, horizon + 1))
+    node_values[leaves, :, 0] = settings["base_populations"][leaves][:, None]
+    node_values[leaves, :, 1:] = settings["base_populations"][leaves][:, None, None] * \
+        np.cumprod(1 + rates, axis=2).transpose(1, 0, 2)
+
+    memory = shared_memory.SharedMemory(name=settings["memory_name"])
+    try:
+        results = np.ndarray(settings["shape"], dtype=np.float64, buffer=memory.buf)
+        results[first:last] = hierarchy.roll_up(node_values).transpose(1, 0, 2)
+        del results
+    finally:
+        memory.close()
+    return count
+
+
+def summarize_nodes(first, last, quantiles):
+
+    # Returns the quantiles over all trajectories of nodes first..last-1, read from the shared array
+    settings = worker_settings
+    memory = shared_memory.SharedMemory(name=settings["memory_name"])
+    try:
+        results = np.ndarray(settings["shape"], dtype=np.float64, buffer=memory.buf)
+        summary = np.quantile(results[:, first:last, :], quantiles, axis=0)
+        del results
+    finally:
+        memory.close()
+    return summary
+
+
+def project(region, continent, hierarchy=None, horizon=30, trajectories=10000, seed=0, workers=None,
+            chunk_size=500, quantiles=(0.05, 0.5, 0.95), history=3, volatility_scale=1.0, persistence=0.0):
+
+    # Runs the simulation and returns a DataFrame with the quantiles of the population for every area
+    # (Name, Table) and every year from the base year until horizon years later
+    if hierarchy is None:
+        hierarchy = Hierarchy.from_csv()
+    if not 0 <= persistence < 1:
+        raise ValueError("persistence must be at least 0 and below 1.")
+    base_year, base_populations, mean_rates, volatility = growth_parameters(hierarchy, region, continent, history)
+
+    shape = (trajectories, len(hierarchy.series), horizon + 1)
+    memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    try:
+        settings = {
+            "hierarchy": hierarchy, "horizon": horizon, "shape": shape, "memory_name": memory.name,
+            "base_populations": base_populations, "mean_rates": mean_rates, "volatility": volatility,
+            "volatility_scale": volatility_scale, "persistence": persistence,
+        }
+        chunks = list(range(0, trajectories, chunk_size))
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=init_worker,
+                                 initargs=(settings,)) as pool:
+            futures = [pool.submit(simulate_chunk, first, min(first + chunk_size, trajectories), seed_sequence)
+                       for first, seed_sequence in zip(chunks, seeds)]
+            for future in futures:
+                future.result()
+
+            # The quantiles are also calculated by the pool, a few nodes per task
+            node_chunk = max(1, -(-len(hierarchy.series) // (4 * (workers or os.cpu_count()))))
+            futures = [pool.submit(summarize_nodes, first, min(first + node_chunk, len(hierarchy.series)), quantiles)
+                       for first in range(0, len(hierarchy.series), node_chunk)]
+            summary = np.concatenate([future.result() for future in futures], axis=1)
+    finally:
+        memory.close()
+        memory.unlink()
+
+    nodes, steps = np.meshgrid(np.arange(len(hierarchy.series)), np.arange(horizon + 1), indexing='ij')
+    table = pd.DataFrame({
+        'Name': hierarchy.names[nodes.ravel()],
+        'Table': hierarchy.tables[nodes.ravel()],
+        'Year': base_year + steps.ravel(),
+    })
+    for quantile, values in zip(quantiles, summary):
+        table[f"p{quantile * 100:g}"] = values.ravel()
+    return table
+
+
+if __name__ == "__main__":
+    from population_loader import load_data
+
+    parser = argparse.ArgumentParser(description="Project the population with Monte Carlo simulations.")
+    parser.add_argument("--trajectories", type=int, default=10000)
+    parser.add_argument("--horizon", type=int, default=30, help="number of years after the last recorded year")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    projection = project(*load_data(), horizon=arguments.horizon, trajectories=arguments.trajectories,
+                         seed=arguments.seed, workers=arguments.workers)
+    last_year = projection['Year'].max()
+    print(projection[(projection['Table'] == 'continent') & (projection['Year'] == last_year)].to_string(index=False))
@@ -0,0 +1,127 @@
+"""
+Result objects of the analyses and the functions that turn them into text.
+
+The Region methods that end in _result only return these small named tuples, so programs that use
+them don't pay for formatting. The render functions make the same sentences and tables as the
+menu shows, and tabulate is only imported when a sorted list is actually rendered.
+"""
+from collections import namedtuple
+
+from population_instrumentation import stage
+
+# The population of one area in one year. population is None when there is no data.
+PopulationResult = namedtuple('PopulationResult', ['area_type', 'area', 'year', 'population'])
+
+# The growth rate of one area in one year. growth_rate is None when there is no data for the
+# year (has_data is False) or no data for an earlier year to compare with.
+GrowthResult = namedtuple('GrowthResult', ['area_type', 'area', 'year', 'growth_rate', 'has_data'])
+
+# All areas with data in one year as (area, value) rows, from the highest to the lowest value.
+# metric is 'population' or 'growth_rate'.
+Ranking = namedtuple('Ranking', ['area_type', 'metric', 'year', 'rows'])
+
+
+def larger_area(first, second, value1, value2):
+    """Helper function that returns the area with the larger value, or None if the values are equal or missing."""
+    if value1 is None or value2 is None or value1 == value2:
+        return None
+    return first.area if value1 > value2 else second.area
+
+
+class PopulationComparison(namedtuple('PopulationComparison', ['first', 'second'])):
+    # Two PopulationResults for the same year
+    __slots__ = ()
+
+    @property
+    def larger(self):
+        return larger_area(self.first, self.second, self.first.population, self.second.population)
+
+
+class GrowthComparison(namedtuple('GrowthComparison', ['first', 'second'])):
+    # Two GrowthResults for the same year
+    __slots__ = ()
+
+    @property
+    def higher(self):
+        return larger_area(self.first, self.second, self.first.growth_rate, self.second.growth_rate)
+
+
+def render_population(result):
+
+    if result.population is None:
+        return f"No data available for {result.area} in {result.year}."
+    return f"Population of {result.area} in {result.year}: {result.population:,}"
+
+
+def render_population_comparison(comparison):
+
+    first, second = comparison.first, comparison.second
+    if first.population is None or second.population is None:
+        return f"Data for one or both {first.area_type}s for the specified year is not available."
+
+    lines = [
+        f"Population in {first.area} in {first.year}: {first.population:,}",
+        f"Population in {second.area} in {second.year}: {second.population:,}",
+    ]
+    if first.population > second.population:
+        lines.append(f"{first.area}s population was greater than {second.area}s population.")
+    elif second.population > first.population:
+        lines.append(f"{second.area}s population was greater than {first.area}s population.")
+    else:
+        lines.append(f"You cannot compare the same {first.area_type}")
+    return "\n".join(lines)
+
+
+def render_growth(result):
+
+    if not result.has_data:
+        return f"No data available for {result.area} in {result.year}."
+    if result.growth_rate is None:
+        return f"No previous data available for {result.area} before {result.year}."
+    return f"Growth rate for {result.area} in {result.year}: {result.growth_rate:.2f}%"
+
+
+def render_growth_comparison(comparison):
+
+    first, second = comparison.first, comparison.second
+    lines = [render_growth(first), render_growth(second)]
+    growth1, growth2 = first.growth_rate, second.growth_rate
+    if growth1 is None or growth2 is None:
+        lines.append("Comparison could not be made due to insufficient data.")
+    elif growth1 > growth2:
+        lines.append(f"{first.area} had a higher growth rate ({growth1:.2f}%) than {second.area} ({growth2:.2f}%) in {first.year}.")
+    elif growth2 > growth1:
+        lines.append(f"{second.area} had a higher growth rate ({growth2:.2f}%) than {first.area} ({growth1:.2f}%) in {first.year}.")
+    else:
+        lines.append(f"{first.area} and {second.area} had the same growth rate ({growth1:.2f}%) in {first.year}.")
+    return "\n".join(lines)
+
+
+def render_ranking(ranking):
+
+    if not ranking.rows:
+        return f"No data available for {ranking.area_type}s in {ranking.year}."
+
+    from tabulate import tabulate
+
+    if ranking.metric == 'population':
+        table = tabulate(ranking.rows, headers=[ranking.area_type.capitalize(), 'Population'], intfmt=',')
+        return f"Here are {ranking.area_type}s sorted population in the year {ranking.year}:\n{table}"
+    table = tabulate(ranking.rows, headers=[ranking.area_type.capitalize(), 'Growth Rate (%)'], floatfmt='.2f')
+    return f"{ranking.area_type.capitalize()}s sorted by growth rate in {ranking.year}:\n{table}"
+
+
+renderers = {
+    PopulationResult: render_population,
+    PopulationComparison: render_population_comparison,
+    GrowthResult: render_growth,
+    GrowthComparison: render_growth_comparison,
+    Ranking: render_ranking,
+}
+
+
+def render(result):
+
+    # Turns any result object into the text the menu shows for it
+    with stage("render"):
+        return renderers[type(result)](result)
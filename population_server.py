@@ -0,0 +1,305 @@
+"""
+Query server for the analyses in the menu.
+
+Loads the data once and answers queries over HTTP on the local machine, using the same queries and
+results as the batch mode (population_batch.py). One Region and one Continent instance are shared by
+all requests, and the requests are handled by a fixed number of worker threads. Keep-alive connections
+wait in a selector between requests, so idle clients do not take a worker away from the others.
+
+    GET  /query?operation=display_population&type=region&area=Caribbean&year=2021
+    POST /batch   with a JSON list of queries, answered with a JSON list of results
+    GET  /health
+    GET  /metrics  timers and counters in the Prometheus text format (start with --instrument)
+
+    python population_server.py --port 8000 --workers 8
+"""
+import argparse
+import json
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import population_instrumentation
+from population_batch import BatchRunner
+from population_loader import load_data
+
+# Largest request body that is accepted by /batch
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, so clients don't have to connect for every query
+    protocol_version = "HTTP/1.1"
+
+    # Send small responses right away instead of waiting to fill a network packet
+    disable_nagle_algorithm = True
+
+    # Give up on a request that has not fully arrived after this many seconds. Idle connections
+    # between requests do not use a worker, see QueryServer.
+    timeout = 10
+
+    def __init__(self, request, client_address, server):
+
+        # The server keeps one handler per connection and calls handle_one_request every time a request
+        # arrives on it, so unlike the standard handlers nothing is handled when the handler is made
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.setup()
+
+    def has_buffered_request(self):
+
+        # Returns True when the next request has already been read into the buffer of rfile, which the
+        # selector can not see. The socket is made non-blocking for a moment so peek never waits.
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def send_json(self, status, content):
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, status, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif url.path == "/metrics":
+            self.send_text(200, population_instrumentation.metrics.to_prometheus(), "text/plain; version=0.0.4")
+        elif url.path == "/query":
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            self.send_json(200, self.server.runner.run_query(query))
+        else:
+            self.send_json(404, {"error": f"Unknown path {url.path}."})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/batch":
+            self.send_json(404, {"error": f"Unknown path {url.path}."})
+            return
+
+        # A length that is not a whole number, or is negative, would make the read below wait for the
+        # end of the connection. The body can not be found then, so the connection is closed.
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self.send_json(400, {"error": "The Content-Length header must be a whole number of 0 or more."})
+            return
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self.send_json(413, {"error": "The batch is too large."})
+            return
+        try:
+            queries = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_json(400, {"error": "The body must be a JSON list of queries."})
+            return
+        if not isinstance(queries, list):
+            self.send_json(400, {"error": "The body must be a JSON list of queries."})
+            return
+        self.send_json(200, [self.server.runner.run_query(query) for query in queries])
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class QueryServer(HTTPServer):
+    # An HTTP server that answers requests with a fixed pool of worker threads. Open connections wait in
+    # a selector between requests, so idle keep-alive clients (like dashboards and browser tabs) do not
+    # hold on to a worker: a connection only gets a worker when a request has arrived on it, and goes
+    # back to the selector after the response. When all workers are busy and the waiting queue is full,
+    # new requests are refused with 503 instead of piling up.
+
+    # Close connections that have been idle for this many seconds
+    idle_timeout = 30
+
+    def __init__(self, address, runner, workers=8, queue_size=64, verbose=False):
+        super().__init__(address, QueryHandler)
+        self.runner = runner
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="population-worker")
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+        # Only the selector thread uses the selector. Other threads hand connections to it through
+        # the returned list and wake it up by writing to the wakeup socket.
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.returned = []
+        self.closing = False
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        self.selector_thread = threading.Thread(target=self.watch_connections, name="population-selector", daemon=True)
+        self.selector_thread.start()
+
+    def process_request(self, request, client_address):
+
+        # New connections wait in the selector until their first request arrives
+        self.return_connection(QueryHandler(request, client_address, self))
+
+    def return_connection(self, handler):
+
+        with self.lock:
+            if not self.closing:
+                self.returned.append(handler)
+                handler = None
+        if handler is not None:
+            self.close_connection(handler)
+            return
+        try:
+            self.wakeup_writer.send(b"x")
+        except OSError:
+            pass
+
+    def watch_connections(self):
+
+        # Waits for requests on the open connections and hands every ready connection to a worker
+        idle_since = {}
+        while True:
+            with self.lock:
+                returned, self.returned = self.returned, []
+                closing = self.closing
+            if closing:
+                break
+            now = time.monotonic()
+            for handler in returned:
+                self.selector.register(handler.connection, selectors.EVENT_READ, handler)
+                idle_since[handler] = now
+
+            for key, _ in self.selector.select(timeout=1):
+                if key.fileobj is self.wakeup_reader:
+                    try:
+                        while self.wakeup_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.selector.unregister(key.fileobj)
+                del idle_since[key.data]
+                self.dispatch(key.data)
+
+            now = time.monotonic()
+            for handler, since in list(idle_since.items()):
+                if now - since > self.idle_timeout:
+                    self.selector.unregister(handler.connection)
+                    del idle_since[handler]
+                    self.close_connection(handler)
+
+        for handler in list(idle_since) + returned:
+            self.close_connection(handler)
+        self.selector.close()
+
+    def dispatch(self, handler):
+
+        # Gives a connection with a request to a worker, or refuses the request when the queue is full
+        if not self.slots.acquire(blocking=False):
+            try:
+                handler.connection.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            except OSError:
+                pass
+            self.close_connection(handler)
+            return
+        self.pool.submit(self.handle_request_in_worker, handler)
+
+    def handle_request_in_worker(self, handler):
+
+        # Answers one request, then returns the connection to the selector unless it is closed.
+        # When the client already sent the next request, it is answered right away.
+        while True:
+            try:
+                handler.handle_one_request()
+                keep_open = not handler.close_connection
+            except Exception:
+                self.handle_error(handler.request, handler.client_address)
+                keep_open = False
+            if not keep_open or not handler.has_buffered_request():
+                break
+        self.slots.release()
+        if keep_open:
+            self.return_connection(handler)
+        else:
+            self.close_connection(handler)
+
+    def close_connection(self, handler):
+
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def server_close(self):
+
+        # Stops accepting connections, closes the idle ones and waits for the requests being answered
+        super().server_close()
+        with self.lock:
+            self.closing = True
+        self.wakeup_writer.send(b"x")
+        self.selector_thread.join()
+        self.pool.shutdown(wait=True)
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+
+def start_server(region, continent, host="127.0.0.1", port=0, workers=8, queue_size=64, verbose=False):
+
+    # Starts a server in a background thread and returns it. With port 0 a free port is chosen,
+    # which can be read from server.server_address. Stop it with server.shutdown() and server.server_close().
+    server = QueryServer((host, port), BatchRunner(region, continent), workers, queue_size, verbose)
+    threading.Thread(target=server.serve_forever, name="population-server", daemon=True).start()
+    return server
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Serve population queries over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--snapshot-dir", help="load the tables from the snapshots in this folder (built there "
+                                               "when missing) instead of the cache, so processes share one copy")
+    parser.add_argument("--instrument", action="store_true", help="time the methods and stages, see /metrics")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.instrument:
+        population_instrumentation.enable()
+
+    region, continent = load_data(snapshot_dir=arguments.snapshot_dir)
+    server = QueryServer((arguments.host, arguments.port), BatchRunner(region, continent),
+                         arguments.workers, arguments.queue_size, arguments.verbose)
+    print(f"Serving population queries on http://{arguments.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Columnar binary snapshots of the region and continent tables.
+
+A snapshot is a folder with one .npy file per column and a meta.json file that describes the
+columns. Text columns are stored as small integer codes plus a list of names, years as int16,
+populations as int64 and the '±% p.a.' column as floats instead of strings like "+2.21%".
+The columns are opened as memory-mapped arrays, so loading a snapshot does not read the whole
+file into memory, and several processes reading the same snapshot share one copy of it.
+
+New rows can be added with append_snapshot, which writes them as a segment folder inside the
+snapshot instead of rewriting it. Writing the snapshot again with write_snapshot joins the segments.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from population_storage import parse_growth_strings, write_atomic, year_column
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".population_snapshot")
+
+
+def encode_column(name, values):
+
+    # Decides how a column is stored, and returns the arrays to save together with its description
+    if name == 'Year':
+        return year_column(values), {"kind": "int"}
+    if name == 'Population':
+        return values.to_numpy(dtype=np.int64), {"kind": "int"}
+    if name == '±% p.a.':
+        return parse_growth_strings(values), {"kind": "float"}
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(), {"kind": "number"}
+
+    # Text columns (Region, Continent) are dictionary encoded
+    codes, categories = pd.factorize(values)
+    code_type = np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32
+    return codes.astype(code_type), {"kind": "category", "categories": [str(category) for category in categories]}
+
+
+def write_columns(data, folder):
+
+    # Saves every column of a DataFrame as a .npy file in a folder and returns the descriptions of the columns
+    columns = []
+    for number, name in enumerate(data.columns):
+        array, description = encode_column(name, data[name])
+        file_name = f"column_{number}.npy"
+        np.save(os.path.join(folder, file_name), array)
+        columns.append({"name": name, "file": file_name, **description})
+    return columns
+
+
+def write_meta(path, meta):
+
+    # Writes meta.json atomically, so a reader sees either the old or the new version
+    def write_json(temporary_path):
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+
+    write_atomic(os.path.join(path, "meta.json"), write_json)
+
+
+def write_snapshot(data, path):
+
+    # Writes a DataFrame to a snapshot folder. Every writer fills its own temporary folder next to the
+    # snapshot, so a reader never opens a half written snapshot, and two writers never mix their files.
+    # The new folder is then swapped in with two renames: the old folder is moved away and the new one
+    # takes its place. Between those renames there is a short moment in which no snapshot exists at
+    # path, and a reader that opens it just then gets a FileNotFoundError and has to try again.
+    parent = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    temporary_path = tempfile.mkdtemp(prefix=f".{name}.", suffix=".tmp", dir=parent)
+    old_path = temporary_path[:-len(".tmp")] + ".old"
+    try:
+        columns = write_columns(data, temporary_path)
+        write_meta(temporary_path, {"version": SNAPSHOT_VERSION, "rows": len(data), "columns": columns, "segments": []})
+
+        # When another writer puts its snapshot in place between the two renames, the rename of the
+        # new folder fails and the other snapshot is moved away too, so the last writer wins
+        for attempt in range(10):
+            if os.path.exists(path):
+                try:
+                    os.replace(path, old_path)
+                except FileNotFoundError:
+                    pass
+            try:
+                os.replace(temporary_path, path)
+                break
+            except OSError:
+                if attempt == 9:
+                    raise
+            finally:
+                shutil.rmtree(old_path, ignore_errors=True)
+    finally:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+
+def read_meta(path):
+
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+        meta = json.load(file)
+    if meta["version"] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {meta['version']} in {path}.")
+    return meta
+
+
+def append_snapshot(data, path):
+
+    # Adds the rows of a DataFrame to a snapshot as a new segment, without rewriting the rows that
+    # are already stored. The segment is only used once meta.json lists it, so an interrupted append
+    # leaves the snapshot as it was. Without a snapshot at path, a new snapshot is written.
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        write_snapshot(data, path)
+        return
+    meta = read_meta(path)
+    if [column["name"] for column in meta["columns"]] != list(data.columns):
+        raise ValueError(f"The columns of the new rows do not match the snapshot in {path}.")
+    if len(data) == 0:
+        return
+
+    segments = meta.get("segments", [])
+    folder = f"segment_{len(segments) + 1}"
+    shutil.rmtree(os.path.join(path, folder), ignore_errors=True)
+    os.makedirs(os.path.join(path, folder))
+    segments.append({"folder": folder, "rows": len(data), "columns": write_columns(data, os.path.join(path, folder))})
+    meta.update(rows=meta["rows"] + len(data), segments=segments)
+    write_meta(path, meta)
+
+
+def read_columns(folder, columns):
+
+    # Opens the .npy files of one folder. Text columns become categoricals built from their codes.
+    arrays = {}
+    for column in columns:
+        array = np.load(os.path.join(folder, column["file"]), mmap_mode='r')
+        if column["kind"] == "category":
+            array = pd.Categorical.from_codes(array, categories=column["categories"])
+        arrays[column["name"]] = array
+    return arrays
+
+
+def read_snapshot(path):
+
+    # Opens a snapshot folder as a DataFrame. Number columns point straight at the memory-mapped
+    # files, and text columns become categoricals built from their codes. When rows were appended
+    # as segments, the columns of all segments are joined, which copies them into memory.
+    meta = read_meta(path)
+    parts = [read_columns(path, meta["columns"])]
+    parts += [read_columns(os.path.join(path, segment["folder"]), segment["columns"]) for segment in meta.get("segments", [])]
+
+    columns = parts[0]
+    if len(parts) > 1:
+        for name, array in columns.items():
+            arrays = [part[name] for part in parts]
+            columns[name] = union_categoricals(arrays) if isinstance(array, pd.Categorical) else np.concatenate(arrays)
+    return pd.DataFrame(columns, copy=False)
+
+
+def write_snapshots(region, continent, snapshot_dir=SNAPSHOT_DIR):
+
+    # Writes the region and continent tables as two snapshots in the same folder
+    os.makedirs(snapshot_dir, exist_ok=True)
+    write_snapshot(region, os.path.join(snapshot_dir, "region"))
+    write_snapshot(continent, os.path.join(snapshot_dir, "continent"))
+
+
+def read_snapshots(snapshot_dir=SNAPSHOT_DIR):
+
+    # Returns the (region, continent) DataFrames from the snapshots in snapshot_dir
+    return read_snapshot(os.path.join(snapshot_dir, "region")), read_snapshot(os.path.join(snapshot_dir, "continent"))
+
+
+def has_snapshots(snapshot_dir=SNAPSHOT_DIR):
+
+    # True when snapshot_dir has both the region and the continent snapshot
+    return all(os.path.exists(os.path.join(snapshot_dir, table, "meta.json")) for table in ("region", "continent"))
+
+
+def convert_csv(csv_path, path):
+
+    # Converts a cleaned table saved as CSV, like continent.csv, into a snapshot
+    write_snapshot(pd.read_csv(csv_path), path)
+
+
+if __name__ == "__main__":
+    # Builds the region and continent snapshots from the bundled CSV data
+    from population_loader import load_data
+
+    snapshot_dir = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_DIR
+    write_snapshots(*load_data(), snapshot_dir)
+    print(f"Snapshots written to {snapshot_dir}")
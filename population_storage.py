@@ -0,0 +1,57 @@
+"""
+Small helpers for storing the population tables, shared by the loader, the snapshots and Region.
+
+write_atomic writes a file so readers never see half of it, parse_growth_strings turns the
+'±% p.a.' strings into floats, and year_column / fits_in check that numbers fit in the compact
+integer columns the tables are stored with.
+"""
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def write_atomic(path, write):
+    """Helper function that writes a file through a temporary file, so readers never see half a file."""
+    # write gets the path of the temporary file. Every writer gets its own temporary file, so two
+    # processes that write the same file at the same time can not publish each other's half written file
+    handle, temporary_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                              dir=os.path.dirname(path) or ".")
+    os.close(handle)
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def parse_growth_strings(values):
+
+    # Converts strings like "+2.21%", "−0.07%" (with a unicode minus) and "—" into floats.
+    # Values that are not a percentage, like the dash in the first year of every region, become NaN.
+    # The same few strings come back in many rows, so only the distinct strings are parsed.
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64)
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype=object).astype(str).str.replace('−', '-', regex=False).str.rstrip('%')
+    parsed = np.append(pd.to_numeric(text, errors='coerce').to_numpy(dtype=np.float64), np.nan)
+    return parsed[codes]
+
+
+def fits_in(integers, dtype):
+
+    # True when every number of an integer array fits in the given integer type
+    limits = np.iinfo(dtype)
+    return not len(integers) or (integers.min() >= limits.min and integers.max() <= limits.max)
+
+
+def year_column(values):
+
+    # Returns the years as an int16 array, which is how every table and snapshot stores them
+    years = np.asarray(values, dtype=np.int64)
+    if not fits_in(years, np.int16):
+        raise ValueError("Years do not fit in an int16 column.")
+    return years.astype(np.int16)
@@ -0,0 +1,253 @@
+"""
+Streaming analyses for tables that are too large to load into memory, like country or district level data.
+
+The table is read from a CSV file in chunks and every chunk flows through a pipeline of generators:
+read_chunks reads the rows, GrowthTracker.annotate adds the growth rate of every row, and consumers
+like TopK and Lookups keep only what they need. The growth rates use the same rule as Region: each
+year is compared with the closest previous year of the same area. The last year and population of
+every area are carried over from one chunk to the next, so areas can be split over chunks.
+
+The rows of every area have to come in the order of their years (the areas can be mixed, so tables
+sorted by area or by year both work). When an (area, year) pair occurs more than once, the first row
+is used like in Region. The results are the same as the in-memory Region methods, while the memory
+only depends on the chunk size, the number of areas and k.
+
+    python population_streaming.py countries.csv --area-column Country --k 10 --years 2020 2021
+"""
+import argparse
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from population_results import Ranking, render
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def read_chunks(path, area_column, chunk_size=DEFAULT_CHUNK_SIZE):
+
+    # Yields the area, Year and Population columns of a CSV file, chunk_size rows at a time.
+    # Rows with a missing area, year or population are left out.
+    for chunk in pd.read_csv(path, usecols=[area_column, 'Year', 'Population'], chunksize=chunk_size):
+        yield chunk.dropna()
+
+
+class GrowthTracker:
+    def __init__(self, area_column):
+
+        # Initialize the tracker with the name of the area column. Every area gets a code in the order
+        # the areas first appear, like the area codes in Region, and the last year and population of
+        # every area are kept between chunks.
+        self.area_column = area_column
+        self.area_names = []
+        self.area_codes = {}
+        self.seen = np.zeros(0, dtype=bool)
+        self.last_years = np.zeros(0, dtype=np.int64)
+        self.last_populations = np.zeros(0, dtype=np.float64)
+
+    def codes(self, names):
+
+        # Returns the code of every name, and gives new names the next codes
+        local_codes, uniques = pd.factorize(names)
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for number, name in enumerate(uniques.tolist()):
+            code = self.area_codes.get(name)
+            if code is None:
+                code = self.area_codes[name] = len(self.area_names)
+                self.area_names.append(name)
+            mapping[number] = code
+
+        # The state arrays grow by doubling, so adding areas is cheap on average
+        if len(self.area_names) > len(self.seen):
+            size = max(len(self.area_names), 2 * len(self.seen))
+            self.seen = np.concatenate([self.seen, np.zeros(size - len(self.seen), dtype=bool)])
+            self.last_years = np.concatenate([self.last_years, np.zeros(size - len(self.last_years), dtype=np.int64)])
+            self.last_populations = np.concatenate([self.last_populations,
+                                                    np.zeros(size - len(self.last_populations))])
+        return mapping[local_codes]
+
+    def process(self, chunk):
+
+        # Returns the rows of one chunk as a DataFrame with area_code, Year, Population and growth_rate,
+        # sorted by area code and year. growth_rate is NaN for the first year of an area.
+        codes = self.codes(chunk[self.area_column])
+        years = chunk['Year'].to_numpy(dtype=np.int64)
+        populations = chunk['Population'].to_numpy(dtype=np.int64)
+
+        # Sort by area, keeping the order of the rows within every area
+        order = np.lexsort((np.arange(len(codes)), codes))
+        codes, years, populations = codes[order], years[order], populations[order]
+        first_row = np.ones(len(codes), dtype=bool)
+        first_row[1:] = codes[1:] != codes[:-1]
+
+        # The year before every row: the row before it in the same area, or the last year of the chunks before
+        previous_years = np.empty_like(years)
+        previous_years[1:] = years[:-1]
+        previous_years[first_row] = self.last_years[codes[first_row]]
+        has_previous = ~first_row | self.seen[codes]
+        if (has_previous & (years < previous_years)).any():
+            area = self.area_names[codes[np.flatnonzero(has_previous & (years < previous_years))[0]]]
+            raise ValueError(f"The rows of {area} are not in the order of their years.")
+
+        # Later rows for a year that was already seen are left out, the first row is used
+        keep = ~(has_previous & (years == previous_years))
+        codes, years, populations = codes[keep], years[keep], populations[keep]
+        first_row = np.ones(len(codes), dtype=bool)
+        first_row[1:] = codes[1:] != codes[:-1]
+        last_row = np.ones(len(codes), dtype=bool)
+        last_row[:-1] = codes[1:] != codes[:-1]
+
+        # Growth rates like Region.build_growth: compared with the closest previous year of the area
+        values = populations.astype(np.float64)
+        previous = np.empty_like(values)
+        previous[1:] = values[:-1]
+        previous[first_row] = self.last_populations[codes[first_row]]
+        has_previous = ~first_row | self.seen[codes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(has_previous, (values - previous) / previous * 100, np.nan)
+
+        # Carry the last year and population of every area over to the next chunk
+        self.last_years[codes[last_row]] = years[last_row]
+        self.last_populations[codes[last_row]] = values[last_row]
+        self.seen[codes[last_row]] = True
+        return pd.DataFrame({'area_code': codes, 'Year': years, 'Population': populations, 'growth_rate': growth})
+
+    def annotate(self, chunks):
+
+        # Yields every chunk with the growth rates added, see process
+        for chunk in chunks:
+            yield self.process(chunk)
+
+
+class TopK:
+    def __init__(self, tracker, k=10, years=None):
+
+        # Keeps the k areas with the highest population and growth rate of every year (or of the given
+        # years) in bounded heaps. Areas with data but without a growth rate are ranked last, and areas
+        # with the same value keep the order of their codes, like the rankings of Region.
+        self.tracker = tracker
+        self.k = k
+        self.years = None if years is None else np.asarray(list(years), dtype=np.int64)
+        self.heaps = {}
+
+    def add(self, chunk):
+
+        if self.years is not None:
+            chunk = chunk[np.isin(chunk['Year'].to_numpy(), self.years)]
+        codes = chunk['area_code'].to_numpy()
+        years = chunk['Year'].to_numpy()
+        for metric, values in (('population', chunk['Population'].to_numpy(dtype=np.float64)),
+                               ('growth_rate', chunk['growth_rate'].to_numpy())):
+            keys = np.where(np.isnan(values), np.inf, -values)
+
+            # Only the best k rows of every year in the chunk can enter the heaps
+            order = np.lexsort((codes, keys, years))
+            sorted_years = years[order]
+            group_start = np.ones(len(order), dtype=bool)
+            group_start[1:] = sorted_years[1:] != sorted_years[:-1]
+            start_positions = np.maximum.accumulate(np.where(group_start, np.arange(len(order)), 0))
+            candidates = order[np.arange(len(order)) - start_positions < self.k]
+
+            for key, code, year, value in zip(keys[candidates].tolist(), codes[candidates].tolist(),
+                                              years[candidates].tolist(), values[candidates].tolist()):
+                # The heap keeps the worst of the best k on top, so it can be replaced by a better row
+                heap = self.heaps.setdefault((metric, year), [])
+                item = (-key, -code, value)
+                if len(heap) < self.k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+    def top_k(self, year, k=None, metric='population'):
+
+        # Returns up to k (area, value) pairs for a year from the highest value down, like Region.top_k
+        if metric not in ('population', 'growth_rate'):
+            raise ValueError(f"Unknown metric {metric}. Use 'population' or 'growth_rate'.")
+        k = self.k if k is None else min(k, self.k)
+        rows = sorted(self.heaps.get((metric, year), []), reverse=True)[:k]
+        if metric == 'population':
+            return [(self.tracker.area_names[-code], int(value)) for _, code, value in rows]
+        return [(self.tracker.area_names[-code], None if np.isnan(value) else float(value)) for _, code, value in rows]
+
+    def all_years(self):
+        return sorted({year for _, year in self.heaps})
+
+
+class Lookups:
+    def __init__(self, tracker, queries):
+
+        # Collects the population and growth rate of the given (area, year) pairs while the chunks pass
+        self.tracker = tracker
+        self.queries = list(queries)
+        self.populations = [None] * len(self.queries)
+        self.growth_rates = [None] * len(self.queries)
+
+    def add(self, chunk):
+
+        if not self.queries:
+            return
+        codes = np.array([self.tracker.area_codes.get(area, -1) for area, _ in self.queries], dtype=np.int64)
+        query_years = np.array([year for _, year in self.queries], dtype=np.int64)
+
+        # Every (area, year) pair occurs once per chunk, so it is found with one index lookup
+        chunk_keys = pd.MultiIndex.from_arrays([chunk['area_code'].to_numpy(), chunk['Year'].to_numpy()])
+        positions = chunk_keys.get_indexer(pd.MultiIndex.from_arrays([codes, query_years]))
+        for number in np.flatnonzero(positions >= 0).tolist():
+            row = positions[number]
+            self.populations[number] = int(chunk['Population'].iat[row])
+            growth_rate = chunk['growth_rate'].iat[row]
+            self.growth_rates[number] = None if np.isnan(growth_rate) else float(growth_rate)
+
+    def lookup(self, area, year):
+
+        # Returns the population like Region.lookup, for one of the queried pairs
+        return self.populations[self.queries.index((area, year))]
+
+    def growth_rate(self, area, year):
+
+        # Returns the growth rate like Region.growth_rate, for one of the queried pairs
+        return self.growth_rates[self.queries.index((area, year))]
+
+
+def analyze(path, area_column, k=10, years=None, queries=(), chunk_size=DEFAULT_CHUNK_SIZE, growth_output=None):
+
+    # Streams a CSV file once through the pipeline and returns the TopK and Lookups with the results.
+    # When growth_output is given, every row is also written there with its growth rate.
+    tracker = GrowthTracker(area_column)
+    top = TopK(tracker, k, years)
+    lookups = Lookups(tracker, queries)
+    header = True
+    for chunk in tracker.annotate(read_chunks(path, area_column, chunk_size)):
+        top.add(chunk)
+        lookups.add(chunk)
+        if growth_output is not None:
+            output = chunk.assign(**{area_column: np.asarray(tracker.area_names, dtype=object)[chunk['area_code'].to_numpy()]})
+            output[[area_column, 'Year', 'Population', 'growth_rate']].to_csv(growth_output, mode='w' if header else 'a',
+                                                                            header=header, index=False)
+            header = False
+    return top, lookups
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Rank areas by population and growth rate in a CSV file that is read in chunks.")
+    parser.add_argument("path", help="CSV file with an area column, Year and Population")
+    parser.add_argument("--area-column", default="Region")
+    parser.add_argument("--k", type=int, default=10, help="number of areas per ranking")
+    parser.add_argument("--years", type=int, nargs="+", help="years to rank, by default the last year")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--growth-output", help="also write every row with its growth rate to this CSV file")
+    arguments = parser.parse_args(arguments)
+
+    top, _ = analyze(arguments.path, arguments.area_column, arguments.k, arguments.years,
+                     chunk_size=arguments.chunk_size, growth_output=arguments.growth_output)
+    years = arguments.years or top.all_years()[-1:]
+    area_type = arguments.area_column.lower()
+    for year in years:
+        print(render(Ranking(area_type, 'population', year, top.top_k(year, metric='population'))))
+        print(render(Ranking(area_type, 'growth_rate', year, top.top_k(year, metric='growth_rate'))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Per-area time series of the populations, with interpolation between the recorded years.
+
+The data mixes years that are 10 years apart with annual ones. The store keeps the years and
+populations of all areas in two arrays sorted by area and year, with an offset per area, so the
+series of one area is a contiguous slice. Years are found with binary search, which makes it
+possible to estimate the population of any area in any year, and to answer many of those
+questions in one vectorized call.
+"""
+import numpy as np
+import pandas as pd
+
+
+class TimeSeriesStore:
+    def __init__(self, area_names, offsets, years, populations):
+
+        # Initialize the store with the series of every area. The series of area number i are
+        # years[offsets[i]:offsets[i + 1]] and populations[offsets[i]:offsets[i + 1]], sorted by year.
+        self.area_names = list(area_names)
+        self.area_codes = {name: code for code, name in enumerate(self.area_names)}
+        self.area_index = pd.Index(self.area_names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.populations = np.asarray(populations, dtype=np.float64)
+
+        # One sorted key per point (area number, then year), used to binary search many areas at once.
+        # Every area gets a block of stride numbers, and a year is placed in the block of its area.
+        self.first_year = int(self.years.min()) if len(self.years) else 0
+        self.stride = (int(self.years.max()) - self.first_year + 3) if len(self.years) else 3
+        area_of_point = np.repeat(np.arange(len(self.area_names)), np.diff(self.offsets))
+        self.keys = area_of_point * float(self.stride) + (self.years - self.first_year + 1)
+
+    @classmethod
+    def from_frame(cls, data, area_column):
+
+        # Builds the store from a table with Year, Population and an area column. When an (area, year)
+        # pair occurs more than once the first row is used, like the lookups in Region do.
+        data = data[[area_column, 'Year', 'Population']].dropna()
+        data = data.drop_duplicates(subset=[area_column, 'Year'], keep='first')
+        area_codes, area_names = pd.factorize(data[area_column])
+        years = data['Year'].to_numpy(dtype=np.int64)
+        order = np.lexsort((years, area_codes))
+        offsets = np.zeros(len(area_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(area_codes, minlength=len(area_names)), out=offsets[1:])
+        return cls(area_names.tolist(), offsets, years[order], data['Population'].to_numpy()[order])
+
+    def series(self, area_name):
+
+        # Returns the years and populations of one area. Both are views, nothing is copied.
+        code = self.area_codes[area_name]
+        start, end = self.offsets[code], self.offsets[code + 1]
+        return self.years[start:end], self.populations[start:end]
+
+    def range_query(self, area_name, start_year, end_year):
+
+        # Returns the recorded years and populations of one area from start_year to end_year (both
+        # included) as views on the store, found with binary search instead of a mask over the area.
+        years, populations = self.series(area_name)
+        first = np.searchsorted(years, start_year, side='left')
+        last = np.searchsorted(years, end_year, side='right')
+        return years[first:last], populations[first:last]
+
+    def interpolate_many(self, area_names, years, method='linear', extrapolate=False):
+
+        # Estimates the population for many (area, year) pairs in one vectorized call.
+        # method is 'linear' (a straight line between the recorded years) or 'log' (a constant growth
+        # rate between the recorded years). Recorded years give the recorded population. Outside the
+        # recorded years the result is NaN, unless extrapolate is True, then the first or last
+        # stretch of the series is extended. Unknown areas give NaN.
+        area_names = np.atleast_1d(np.asarray(area_names, dtype=object))
+        codes = self.area_index.get_indexer(area_names.ravel()).reshape(area_names.shape)
+        return self.interpolate_codes(codes, years, method, extrapolate)
+
+    def interpolate_codes(self, codes, years, method='linear', extrapolate=False):
+
+        # Does the work of interpolate_many, with area numbers instead of names (-1 for unknown areas)
+        if method not in ('linear', 'log'):
+            raise ValueError(f"Unknown method {method}. Use 'linear' or 'log'.")
+        codes, years = np.broadcast_arrays(np.atleast_1d(codes), np.atleast_1d(np.asarray(years, dtype=np.float64)))
+        result = np.full(codes.shape, np.nan)
+
+        known = codes >= 0
+        codes, query_years = codes[known], years[known]
+        start, end = self.offsets[codes], self.offsets[codes + 1]
+        usable = end - start >= 1
+
+        # Binary search for the recorded year at or before the requested year, within the area
+        offset = np.clip(query_years - self.first_year + 1, 0, self.stride - 0.5)
+        left = np.searchsorted(self.keys, codes * float(self.stride) + offset, side='right') - 1
+
+        # Every point needs a stretch between two recorded years. Before the first or after the last
+        # recorded year, the first or last stretch of the area is used.
+        left = np.clip(left, start, np.maximum(end - 2, start))
+        right = np.minimum(left + 1, end - 1)
+        left_index, right_index = np.where(usable, left, 0), np.where(usable, right, 0)
+        year0, year1 = self.years[left_index], self.years[right_index]
+        value0, value1 = self.populations[left_index], self.populations[right_index]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(year1 != year0, (query_years - year0) / (year1 - year0), 0.0)
+            if method == 'linear':
+                values = value0 + fraction * (value1 - value0)
+            else:
+                values = value0 * np.power(value1 / value0, fraction)
+
+        # Recorded years give the recorded population, without any rounding from the formulas above
+        values = np.where(query_years == year0, value0, np.where(query_years == year1, value1, values))
+
+        inside = (query_years >= self.years[np.where(usable, start, 0)]) & (query_years <= self.years[np.where(usable, end - 1, 0)])
+        if not extrapolate:
+            values = np.where(inside, values, np.nan)
+        else:
+            # A single recorded year can't be extended, so it only answers for its own year
+            values = np.where((end - start >= 2) | inside, values, np.nan)
+        result[known] = np.where(usable, values, np.nan)
+        return result
+
+    def interpolate(self, area_name, years, method='linear', extrapolate=False):
+
+        # Estimates the population of one area in one or more years, see interpolate_many
+        result = self.interpolate_many(area_name, years, method, extrapolate)
+        return result if np.ndim(years) else float(result[0])
+
+    def grid(self, years, method='linear', extrapolate=False):
+
+        # Returns an area-by-year matrix with the population of every area in every given year,
+        # for example grid(range(1950, 2101)), in one vectorized pass
+        years = np.asarray(list(years), dtype=np.float64)
+        codes = np.arange(len(self.area_names))[:, None]
+        return self.interpolate_codes(codes, years[None, :], method, extrapolate)
+
+    def cagr(self, area_names, start_years, end_years, method='log'):
+
+        # Returns the compound annual growth rate in percent per year between two years, which don't
+        # have to be recorded years. Works for one area or for arrays of areas and years at once.
+        start_years = np.asarray(start_years, dtype=np.float64)
+        end_years = np.asarray(end_years, dtype=np.float64)
+        start = self.interpolate_many(area_names, start_years, method)
+        end = self.interpolate_many(area_names, end_years, method)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (np.power(end / start, 1 / (end_years - start_years)) - 1) * 100
+        if np.ndim(area_names) == 0 and np.ndim(start_years) == 0 and np.ndim(end_years) == 0:
+            return float(result[0])
+        return result
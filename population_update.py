@@ -0,0 +1,110 @@
+"""
+Incremental updates of the loaded data.
+
+When new figures arrive, like the estimates for a new year, only the new rows are added: the Region
+and Continent indexes are extended in place, the growth rates and rankings are only calculated again
+for the areas and years that changed, the hierarchy totals are only added up again for the changed
+years, and the rows are written to the snapshots as a new segment. The cost of an update depends on
+the number of new rows, not on the size of the history.
+
+The new rows come as a table with Name, Year and Population, and optionally '±% p.a.' and Table
+(region or continent), which is needed for names that are used in both tables, like North America.
+Rows for (area, year) pairs that are already in the data are left out.
+
+    python population_update.py estimates_2025.csv --snapshot-dir .population_snapshot
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from population_group19 import Continent, Region
+from population_hierarchy import HIERARCHY_FILE, Hierarchy
+from population_loader import load_data
+from population_snapshot import SNAPSHOT_DIR, append_snapshot, has_snapshots, read_snapshots, write_snapshot
+
+
+class IncrementalDataset:
+    def __init__(self, region, continent, hierarchy=None, snapshot_dir=None):
+
+        # Initialize the dataset with a Region and a Continent instance. The node-by-year populations of
+        # the hierarchy and their totals are kept, so they can be updated for new rows.
+        # When snapshot_dir is given, every update is also written to the snapshots in that folder.
+        self.hierarchy = hierarchy if hierarchy is not None else Hierarchy.from_csv()
+        self.instances = {'region': region, 'continent': continent}
+        self.snapshot_dir = snapshot_dir
+        self.matrix, self.years = self.hierarchy.population_matrix(region.data, continent.data)
+        self.totals = self.hierarchy.roll_up(self.matrix)
+
+    def prepare(self, rows):
+
+        # Returns the new rows per table, with Region_nr and the area column like the cleaned tables
+        rows = rows.rename(columns={'Pop.': 'Population'})
+        if 'Region_nr' not in rows.columns:
+            series = self.hierarchy.series_of(rows['Name'], rows['Table'] if 'Table' in rows.columns else None)
+            if (series < 0).any():
+                unknown = sorted(set(rows['Name'][series < 0]))
+                raise ValueError(f"These areas are not in the hierarchy: {unknown}")
+            rows = rows.drop(columns=[column for column in ('Name', 'Table') if column in rows.columns])
+            rows['Region_nr'] = series
+        return self.hierarchy.split(rows)
+
+    def append(self, rows):
+
+        # Adds the new rows and returns the rows that were added, per table
+        added = {table: self.instances[table].append(part) for table, part in self.prepare(rows).items()}
+        self.update_totals(pd.concat([part[['Region_nr', 'Year', 'Population']] for part in added.values()]))
+
+        if self.snapshot_dir is not None:
+            for table, part in added.items():
+                path = os.path.join(self.snapshot_dir, table)
+                if os.path.exists(os.path.join(path, "meta.json")):
+                    append_snapshot(part, path)
+                else:
+                    write_snapshot(self.instances[table].data, path)
+        return added
+
+    def update_totals(self, rows):
+
+        # Puts the new populations in the node-by-year matrix, and adds up the totals again for their years only
+        if len(rows) == 0:
+            return
+        years = rows['Year'].to_numpy(dtype=np.int64)
+        new_years = np.setdiff1d(years, self.years)
+        if len(new_years):
+            positions = np.searchsorted(self.years, new_years)
+            self.matrix = np.insert(self.matrix, positions, np.nan, axis=1)
+            self.totals = np.insert(self.totals, positions, np.nan, axis=1)
+            self.years = np.insert(self.years, positions, new_years)
+
+        nodes = self.hierarchy.series_index.get_indexer(rows['Region_nr'])
+        columns = np.searchsorted(self.years, years)
+        self.matrix[nodes, columns] = rows['Population'].to_numpy(dtype=np.float64)
+        self.hierarchy.update_roll_up(self.totals, self.matrix, np.unique(columns))
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Add new population figures to the snapshots.")
+    parser.add_argument("rows", help="CSV file with Name, Year, Population and optionally Table")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--hierarchy", default=HIERARCHY_FILE)
+    arguments = parser.parse_args(arguments)
+
+    # Start from the snapshots when they exist, and from the bundled data otherwise
+    snapshot_dir = arguments.snapshot_dir
+    if has_snapshots(snapshot_dir):
+        region, continent = read_snapshots(snapshot_dir)
+    else:
+        region, continent = load_data(hierarchy_path=arguments.hierarchy)
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    dataset = IncrementalDataset(Region(region), Continent(continent), Hierarchy.from_csv(arguments.hierarchy), snapshot_dir)
+    added = dataset.append(pd.read_csv(arguments.rows))
+    for table, rows in added.items():
+        print(f"{len(rows)} new {table} rows added to {os.path.join(snapshot_dir, table)}")
+
+
+if __name__ == "__main__":
+    main()
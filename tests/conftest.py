@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules live in the folder above the tests
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+
+@pytest.fixture(scope="session")
+def tables(tmp_path_factory):
+
+    # The cleaned (region, continent) tables of the bundled region.csv, with a cache outside the repository
+    from population_loader import load_data
+
+    return load_data(cache_dir=str(tmp_path_factory.mktemp("cache")))
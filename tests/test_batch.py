@@ -0,0 +1,80 @@
+import io
+import json
+import os
+
+import pytest
+
+from population_batch import BatchRunner, main, parse_year, read_queries
+
+
+@pytest.fixture(scope="module")
+def runner(tables):
+    return BatchRunner(*tables)
+
+
+def run_lines(runner, lines):
+    return list(runner.run(read_queries(io.StringIO("\n".join(lines) + "\n"), "jsonl")))
+
+
+@pytest.mark.parametrize("value, year", [
+    (2021, 2021), (2021.0, 2021), ("2021", 2021), (" 1950 ", 1950),
+    (2021.9, None), (True, None), (float("inf"), None), (float("nan"), None), ("2021.5", None),
+    ("-2021", None), ("²", None), (None, None), ([2021], None), ({"year": 2021}, None),
+])
+def test_parse_year(value, year):
+    assert parse_year(value) == year
+
+
+def test_malformed_lines_do_not_stop_the_run(runner):
+
+    good = '{"operation": "display_population", "type": "continent", "area": "Asia", "year": 2021}'
+    results = run_lines(runner, [
+        good,
+        'not json',
+        '[1, 2]',
+        '"text"',
+        '{"operation": "display_population", "type": 5, "area": "Asia", "year": 2021}',
+        '{"operation": "display_population", "area": ["Asia"], "year": 2021}',
+        '{"operation": "population_comparison", "areas": "Asia", "year": 2021}',
+        '{"operation": "display_population", "type": "continent", "area": "Asia", "year": 1e400}',
+        '{"operation": "display_population", "type": "continent", "area": "Asia", "year": Infinity}',
+        '{"operation": "display_population", "type": "continent", "area": "Asia", "year": 2021.9}',
+        '{"operation": "display_population", "type": "continent", "area": "Asia", "year": true}',
+        '{"operation": "display_population", "type": "planet", "area": "Asia", "year": 2021}',
+        '{"operation": "unknown", "type": "continent", "area": "Asia", "year": 2021}',
+        good,
+    ])
+    assert len(results) == 14
+    assert results[0]["population"] == results[-1]["population"] == 4694576167
+    assert "error" not in results[0] and "error" not in results[-1]
+    assert all("error" in result for result in results[1:-1])
+    assert results[1]["error"] == "Line 2 is not valid JSON."
+    assert results[7]["error"] == results[10]["error"] == "The query needs a valid year."
+
+    # Every result can be written as JSON
+    for result in results:
+        json.dumps(result)
+
+
+def test_csv_queries(runner):
+
+    text = "operation,type,area,year\ndisplay_population,continent,Asia,2021\ndisplay_population,continent,Asia,\n"
+    results = list(runner.run(read_queries(io.StringIO(text), "csv")))
+    assert results[0]["population"] == 4694576167
+    assert results[1]["error"] == "The query needs a valid year."
+
+
+def test_batch_from_snapshots(tables, tmp_path):
+
+    # With --snapshot-dir the snapshots are built on the first run and read on the next, with the same answers
+    queries = tmp_path / "queries.jsonl"
+    queries.write_text('{"operation": "display_population", "type": "continent", "area": "Asia", "year": 2021}\n'
+                       '{"operation": "population_ranking", "type": "region", "year": 2000}\n', encoding="utf-8")
+    results = BatchRunner(*tables).run(read_queries(io.StringIO(queries.read_text(encoding="utf-8")), "jsonl"))
+    expected = [json.dumps(result, ensure_ascii=False) for result in results]
+    snapshot_dir = tmp_path / "snapshots"
+    for run in range(2):
+        output = tmp_path / f"output_{run}.jsonl"
+        main([str(queries), "--snapshot-dir", str(snapshot_dir), "--output", str(output)])
+        assert sorted(os.listdir(snapshot_dir)) == ["continent", "region"]
+        assert output.read_text(encoding="utf-8").splitlines() == expected
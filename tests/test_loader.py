@@ -0,0 +1,99 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from population_loader import (FixtureDirectorySource, HtmlSnapshotSource, LocalFilesSource, load_data,
+                               recognize_table)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SPLIT_DIR = os.path.join(FIXTURES_DIR, "split")
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def assert_same_tables(loaded, expected):
+
+    # Compares loaded (region, continent) tables with the tables of the bundled region.csv
+    for table, expected_table in zip(loaded, expected):
+        pd.testing.assert_frame_equal(table, expected_table)
+
+
+def test_saved_page_with_extra_tables(tables, tmp_path):
+
+    # The population series are found by their headers between tables that are not population series
+    pytest.importorskip("lxml")
+    loaded = load_data(HtmlSnapshotSource(os.path.join(FIXTURES_DIR, "wikipedia.html")), cache_dir=str(tmp_path))
+    assert_same_tables(loaded, tables)
+
+
+def test_directory_of_csv_files(tables, tmp_path):
+
+    # Several series per file, every file starts a new series, and sources.csv is not a population table
+    loaded = load_data(FixtureDirectorySource(SPLIT_DIR, workers=2), cache_dir=str(tmp_path))
+    assert_same_tables(loaded, tables)
+
+
+def test_long_file_with_names(tables, tmp_path):
+
+    # Location, Table, Time and PopTotal (in thousands) like the UN World Population Prospects
+    loaded = load_data(LocalFilesSource([os.path.join(FIXTURES_DIR, "long.csv")]), cache_dir=str(tmp_path))
+    assert_same_tables(loaded, [table.drop(columns='±% p.a.') for table in tables])
+
+
+def test_parse_in_processes(tables, tmp_path):
+
+    pytest.importorskip("lxml")
+    paths = [os.path.join(FIXTURES_DIR, "wikipedia.html")]
+    loaded = load_data(LocalFilesSource(paths, workers=2, processes=True), cache_dir=str(tmp_path))
+    assert_same_tables(loaded, tables)
+
+
+def test_recognize_table():
+
+    assert recognize_table(pd.DataFrame({'Continent': ['Asia'], 'Population': [1]})) is None
+    assert recognize_table(pd.DataFrame({'Year': [1950], 'Event': ['First estimate']})) is None
+    table = recognize_table(pd.DataFrame({('Asia', 'Year'): ['1950', '2021[3]', 'Note'],
+                                          ('Asia', 'Pop.'): ['1,000', '2,000', '']}))
+    assert table['Year'].tolist() == [1950, 2021] and table['Pop.'].tolist() == [1000, 2000]
+    table = recognize_table(pd.DataFrame({'Location': ['Asia'], 'Time': [2021], 'PopTotal': [4694576.167]}))
+    assert table['Pop.'].tolist() == [4694576167] and table['Name'].tolist() == ['Asia']
+
+
+def test_file_cache(tmp_path):
+
+    # The parsed files are cached in the cache folder of load_tables, and only changed files are parsed again
+    directory = tmp_path / "sources"
+    shutil.copytree(SPLIT_DIR, directory)
+    cache_dir = tmp_path / "cache"
+    load_data(FixtureDirectorySource(str(directory)), cache_dir=str(cache_dir))
+    cached_files = set(os.listdir(cache_dir / "files"))
+    assert len(cached_files) == 4
+
+    with open(directory / "sources.csv", "a", encoding="utf-8") as file:
+        file.write("Population Reference Bureau,https://www.prb.org/\n")
+    load_data(FixtureDirectorySource(str(directory)), cache_dir=str(cache_dir))
+    assert len(set(os.listdir(cache_dir / "files")) - cached_files) == 1
+
+
+def test_unknown_names(tables, tmp_path):
+
+    # continent.csv uses names like "Total Africa" that are not in the hierarchy
+    directory = tmp_path / "sources"
+    shutil.copytree(SPLIT_DIR, directory)
+    shutil.copy(os.path.join(PACKAGE_DIR, "continent.csv"), directory / "04_continent.csv")
+    with pytest.raises(ValueError, match="Total Africa"):
+        load_data(FixtureDirectorySource(str(directory)), cache_dir=str(tmp_path / "cache"))
+
+    loaded = load_data(FixtureDirectorySource(str(directory)), cache_dir=str(tmp_path / "cache"), drop_unknown=True)
+    assert_same_tables(loaded, tables)
+
+
+def test_unknown_series(tmp_path):
+
+    # A series more than the hierarchy has is an error too
+    directory = tmp_path / "sources"
+    shutil.copytree(SPLIT_DIR, directory)
+    pd.DataFrame({'Year': [1950, 2021], 'Pop.': [1, 2]}).to_csv(directory / "05_extra.csv", index=False)
+    with pytest.raises(ValueError, match="series 26"):
+        load_data(FixtureDirectorySource(str(directory)), cache_dir=str(tmp_path / "cache"))
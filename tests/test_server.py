@@ -0,0 +1,94 @@
+import http.client
+import json
+import socket
+import time
+
+import pytest
+
+from population_batch import BatchRunner
+from population_loadtest import load_test, make_queries, open_idle_connections
+from population_server import start_server
+
+
+def test_idle_connections_do_not_hold_workers(tables):
+
+    # Two workers and more idle keep-alive connections than workers: other clients are still answered right away
+    server = start_server(*tables, workers=2)
+    host, port = server.server_address[:2]
+    try:
+        idle_connections = open_idle_connections(host, port, 4)
+        begin = time.perf_counter()
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        connection.request("GET", "/health")
+        assert connection.getresponse().status == 200
+        assert time.perf_counter() - begin < 2
+
+        # The idle connections can still be used afterwards
+        for idle_connection in idle_connections:
+            idle_connection.request("GET", "/health")
+            assert idle_connection.getresponse().read() == b'{"status": "ok"}'
+    finally:
+        begin = time.perf_counter()
+        server.shutdown()
+        server.server_close()
+        assert time.perf_counter() - begin < 5
+
+
+def test_more_clients_than_workers(tables):
+
+    server = start_server(*tables, workers=2)
+    host, port = server.server_address[:2]
+    try:
+        statistics = load_test(host, port, make_queries(*tables, 200), clients=8, idle_clients=4)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert statistics["errors"] == 0
+    assert statistics["requests"] == 200
+
+
+@pytest.mark.parametrize("length", ["-5", "abc"])
+def test_invalid_content_length(tables, length):
+
+    # The request is refused right away, and does not keep the only worker from other clients
+    server = start_server(*tables, workers=1)
+    host, port = server.server_address[:2]
+    try:
+        connection = socket.create_connection((host, port), timeout=10)
+        connection.sendall(f"POST /batch HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n[]".encode())
+        begin = time.perf_counter()
+        assert connection.recv(4096).startswith(b"HTTP/1.1 400")
+        health = http.client.HTTPConnection(host, port, timeout=10)
+        health.request("GET", "/health")
+        assert health.getresponse().status == 200
+        assert time.perf_counter() - begin < 2
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_malformed_batch_queries(tables):
+
+    server = start_server(*tables, workers=2)
+    host, port = server.server_address[:2]
+    try:
+        connection = http.client.HTTPConnection(host, port, timeout=10)
+        body = '[1, {"type": 5, "operation": "display_population", "area": "Asia", "year": 2021}, ' \
+               '{"operation": "display_population", "type": "continent", "area": "Asia", "year": 1e400}]'
+        connection.request("POST", "/batch", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        assert response.status == 200
+        assert all("error" in result for result in json.loads(response.read()))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_rankings_cache_only_years_with_data(tables):
+
+    runner = BatchRunner(*tables)
+    for year in range(3000, 3100):
+        assert runner.run_query({"operation": "population_sort", "type": "region", "year": year})["ranking"] == []
+    runner.run_query({"operation": "population_sort", "type": "region", "year": 2021})
+    assert list(runner.rankings) == [("region", "population", 2021)]
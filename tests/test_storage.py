@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from population_storage import fits_in, parse_growth_strings, write_atomic, year_column
+
+
+def test_parse_growth_strings():
+    values = pd.Series(['+2.21%', '−0.07%', '—', '+2.21%', None])
+    np.testing.assert_array_equal(parse_growth_strings(values), [2.21, -0.07, np.nan, 2.21, np.nan])
+
+
+def test_year_column():
+    assert year_column(pd.Series([1950, 2025])).dtype == np.int16
+    assert fits_in(np.array([], dtype=np.int64), np.int16)
+    with pytest.raises(ValueError):
+        year_column([1950, 40000])
+
+
+def test_write_atomic_cleans_up(tmp_path):
+
+    # A failed write keeps the old file and leaves no temporary file behind
+    path = tmp_path / "table.csv"
+    path.write_text("old")
+
+    def failing_write(temporary_path):
+        with open(temporary_path, "w") as file:
+            file.write("half")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_atomic(str(path), failing_write)
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["table.csv"]
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from population_benchmark import synthetic_table
+from population_group19 import Region
+from population_streaming import analyze
+
+
+@pytest.fixture(scope="module")
+def table_path(tmp_path_factory):
+
+    # A synthetic table sorted by year, with tied populations and repeated (area, year) pairs after the first rows
+    table = synthetic_table(20000, 'region', seed=1)[['Region', 'Year', 'Population']]
+    table.loc[table.index[5::97], 'Population'] = 1_000_000
+    repeated = table.iloc[::501].copy()
+    repeated['Population'] += 7
+    table = pd.concat([table, repeated]).sort_values('Year', kind='stable')
+    path = tmp_path_factory.mktemp("streaming") / "table.csv"
+    table.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [777, 5000, 10**7])
+def test_streaming_matches_region(table_path, chunk_size):
+
+    table = pd.read_csv(table_path)
+    region = Region(table)
+    generator = np.random.default_rng(0)
+    names = table['Region'].unique()
+    years = sorted(table['Year'].unique().tolist())
+    queries = [(str(names[number]), int(year)) for number, year
+               in zip(generator.integers(0, len(names), 100), generator.choice(years, 100))] + [('Nowhere', 2000)]
+
+    top, lookups = analyze(table_path, 'Region', k=10, queries=queries, chunk_size=chunk_size)
+    for year in years:
+        for metric in ('population', 'growth_rate'):
+            assert top.top_k(year, 10, metric) == region.top_k(year, 10, metric)
+    for area, year in queries:
+        assert lookups.lookup(area, year) == region.lookup(area, year)
+        assert lookups.growth_rate(area, year) == region.growth_rate(area, year)
+
+
+def test_streaming_growth_output(table_path, tmp_path):
+
+    # The growth rates written while streaming are the ones of Region
+    output = tmp_path / "growth.csv"
+    analyze(table_path, 'Region', chunk_size=3000, growth_output=str(output))
+    region = Region(pd.read_csv(table_path))
+    written = pd.read_csv(output)
+    assert len(written) == len(region.data.drop_duplicates(['Region', 'Year']))
+    for row in written.sample(200, random_state=0).itertuples():
+        expected = region.growth_rate(row.Region, row.Year)
+        assert (np.isnan(row.growth_rate) and expected is None) or row.growth_rate == pytest.approx(expected)
+
+
+def test_rows_out_of_order(tmp_path):
+
+    path = tmp_path / "table.csv"
+    pd.DataFrame({'Region': ['a', 'a'], 'Year': [2000, 1990], 'Population': [1, 2]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="not in the order of their years"):
+        analyze(str(path), 'Region')
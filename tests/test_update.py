@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from population_group19 import Continent, Region
+from population_hierarchy import Hierarchy
+from population_snapshot import read_snapshots, write_snapshots
+from population_update import IncrementalDataset
+
+
+def assert_same_as_rebuilt(dataset, full_region, full_continent, hierarchy):
+
+    # Every query of the updated instances gives the same answer as instances built from the full tables
+    for cls, full in ((Region, full_region), (Continent, full_continent)):
+        rebuilt = cls(full)
+        updated = dataset.instances[rebuilt.area_type()]
+        area_column = rebuilt.area_type().capitalize()
+        assert len(updated.data) == len(full)
+        for year in sorted(int(year) for year in full['Year'].unique()):
+            assert updated.population_ranking(year) == rebuilt.population_ranking(year)
+            assert updated.growth_ranking(year) == rebuilt.growth_ranking(year)
+            assert updated.top_k(year, 3, 'growth_rate') == rebuilt.top_k(year, 3, 'growth_rate')
+            for area in full[area_column].unique():
+                assert updated.lookup(area, year) == rebuilt.lookup(area, year)
+                assert updated.growth_rate(area, year) == rebuilt.growth_rate(area, year)
+                assert updated.rank_of(area, year) == rebuilt.rank_of(area, year)
+                assert updated.rank_of(area, year, 'growth_rate') == rebuilt.rank_of(area, year, 'growth_rate')
+        area = full[area_column].iloc[0]
+        assert updated.timeseries.interpolate(area, 2000.5) == rebuilt.timeseries.interpolate(area, 2000.5)
+
+    matrix, years = hierarchy.population_matrix(full_region, full_continent)
+    np.testing.assert_array_equal(dataset.years, years)
+    np.testing.assert_array_equal(dataset.totals, hierarchy.roll_up(matrix))
+
+
+def make_dataset(region, continent, hierarchy, snapshot_dir=None):
+
+    # The ranks are built first, so the test also covers updating them
+    instances = Region(region), Continent(continent)
+    for instance in instances:
+        instance.build_ranks('population')
+        instance.build_ranks('growth_rate')
+    return IncrementalDataset(*instances, hierarchy, snapshot_dir)
+
+
+def new_rows(region, continent):
+
+    # The rows as they come from outside, with Name and Table
+    return pd.concat([region.rename(columns={'Region': 'Name'}).assign(Table='region'),
+                      continent.rename(columns={'Continent': 'Name'}).assign(Table='continent')])[['Name', 'Table', 'Year', 'Population']]
+
+
+@pytest.fixture(scope="module")
+def hierarchy():
+    return Hierarchy.from_csv()
+
+
+def test_append_new_year(tables, hierarchy):
+
+    region, continent = tables
+    last = region['Year'].max()
+    dataset = make_dataset(region[region['Year'] < last], continent[continent['Year'] < last], hierarchy)
+    added = dataset.append(new_rows(region[region['Year'] == last], continent[continent['Year'] == last]))
+    assert len(added['region']) == (region['Year'] == last).sum()
+    assert_same_as_rebuilt(dataset, region, continent, hierarchy)
+
+    # Rows that are already in the data are left out
+    added = dataset.append(new_rows(region[region['Year'] == last], continent[continent['Year'] == last]))
+    assert all(len(rows) == 0 for rows in added.values())
+
+
+def test_append_missing_years_and_new_area(tables, hierarchy):
+
+    region, continent = tables
+    new_region = (region['Year'] == 2000) | (region['Region'] == region['Region'].iloc[-1])
+    new_continent = continent['Year'].isin([1990, 2015])
+    dataset = make_dataset(region[~new_region], continent[~new_continent], hierarchy)
+    dataset.append(new_rows(region[new_region], continent[new_continent]))
+
+    # The rebuilt instances get the rows in the same order as the updated ones
+    assert_same_as_rebuilt(dataset, pd.concat([region[~new_region], region[new_region]]),
+                           pd.concat([continent[~new_continent], continent[new_continent]]), hierarchy)
+
+
+def test_append_unknown_area(tables, hierarchy):
+
+    dataset = make_dataset(*tables, hierarchy)
+    with pytest.raises(ValueError, match="not in the hierarchy"):
+        dataset.append(pd.DataFrame({'Name': ['Atlantis'], 'Year': [2030], 'Population': [1]}))
+
+
+def test_append_to_snapshots(tables, hierarchy, tmp_path):
+
+    region, continent = tables
+    last = region['Year'].max()
+    write_snapshots(region[region['Year'] < last], continent[continent['Year'] < last], str(tmp_path))
+    dataset = make_dataset(*read_snapshots(str(tmp_path)), hierarchy, str(tmp_path))
+    dataset.append(new_rows(region[region['Year'] == last], continent[continent['Year'] == last]))
+    assert (tmp_path / "region" / "segment_1").is_dir()
+
+    # The snapshots with the new segment hold the same rows as the full table
+    snapshot_region, snapshot_continent = read_snapshots(str(tmp_path))
+    assert_same_as_rebuilt(dataset, snapshot_region, snapshot_continent, hierarchy)
+    columns = ['Region', 'Year', 'Population', 'Region_nr']
+    stored = snapshot_region[columns].astype({'Region': str, 'Year': np.int64, 'Region_nr': np.int64})
+    expected = region[columns].astype({'Region': str, 'Year': np.int64, 'Region_nr': np.int64})
+    pd.testing.assert_frame_equal(stored.sort_values(['Region', 'Year']).reset_index(drop=True),
+                                  expected.sort_values(['Region', 'Year']).reset_index(drop=True))
+
+
+def test_append_keeps_compact_columns(tables):
+
+    region, _ = tables
+    last = region['Year'].max()
+    instance = Region(region[region['Year'] < last])
+    instance.append(region[region['Year'] == last])
+    instance.append(pd.DataFrame({'Region': ['Atlantis'], 'Year': [2030], 'Population': [5], '±% p.a.': ['+1.50%']}))
+
+    data = instance.data
+    assert data.dtypes.drop('Region').to_dict() == region.dtypes.drop('Region').to_dict()
+    assert isinstance(data['Region'].dtype, pd.CategoricalDtype)
+    assert data['Region'].cat.categories[-1] == 'Atlantis'
+    assert data['Region_nr'].iloc[-1] == -1 and data['±% p.a.'].iloc[-1] == 1.5
+    assert 'Atlantis' not in region['Region'].cat.categories
+
+
+def test_reading_data_from_threads(tables):
+
+    # Threads that read .data right after an append all get every row exactly once
+    region, _ = tables
+    last = region['Year'].max()
+    for _ in range(20):
+        instance = Region(region[region['Year'] < last])
+        instance.append(region[region['Year'] == last])
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            lengths = list(executor.map(lambda _: len(instance.data), range(8)))
+        assert lengths == [len(region)] * 8
+        assert len(instance.data) == len(region)